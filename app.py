@@ -1,42 +1,108 @@
-from flask import Flask, render_template, request
+import settings  # noqa: F401 (loads .env; must come first)
+
+from flask import Flask, Response, render_template, request, stream_with_context
+from http_session import close_session
+from metrics import render as render_metrics
+from parsing import shutdown_executor
+from pipeline import QueryFailed
+from workspace import new_run_id
+from backends import BACKENDS, DEFAULT_MODEL, MODELS, SSE_KEEPALIVE_SECONDS, run_query, sse, warm_backends
 import asyncio
+import atexit
+import queue
+import threading
 
 app = Flask(__name__)
 
+# One long-lived event loop serves every query, so async clients and
+# connection pools are reused instead of being rebuilt per request. It is
+# started on first use rather than at import: parse workers re-import this
+# module and must not each start a loop of their own.
+loop = None
+loop_lock = threading.Lock()
+
+def get_loop():
+    global loop
+    with loop_lock:
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='qpal-event-loop', daemon=True).start()
+            atexit.register(shutdown)
+    return loop
+
+def shutdown():
+    asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout=5)
+    shutdown_executor()
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    selected_model = 'bedrock'
+    selected_model = DEFAULT_MODEL
     search_query = ''
 
     if request.method == 'POST':
-        search_query = request.form['search_query']
-        selected_model = request.form['model']
+        search_query = request.form.get('search_query', '')
+        selected_model = request.form.get('model', DEFAULT_MODEL)
+        if not search_query or selected_model not in BACKENDS:
+            return render_template('index.html', models=MODELS, final_summary='Missing search query or unknown model.', selected_model=DEFAULT_MODEL, search_query=search_query), 400
 
-        if selected_model == 'bedrock':
-            import main_bedrock
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            final_summary = loop.run_until_complete(main_bedrock.main(search_query))
-        elif selected_model == 'anthropic':
-            import main_anthropic
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            final_summary = loop.run_until_complete(main_anthropic.main(search_query))
-        elif selected_model == 'openai':
-            import main_openai
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            final_summary = loop.run_until_complete(main_openai.main(search_query))
+        future = asyncio.run_coroutine_threadsafe(run_query(selected_model, search_query, run_id=new_run_id()), get_loop())
+        try:
+            final_summary = future.result()
+        except QueryFailed as e:
+            final_summary = str(e)
+
+        return render_template('index.html', models=MODELS, final_summary=final_summary, selected_model=selected_model, search_query=search_query)
+
+    return render_template('index.html', models=MODELS, selected_model=selected_model, search_query=search_query)
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stream')
+def stream():
+    search_query = request.args.get('search_query', '')
+    selected_model = request.args.get('model', DEFAULT_MODEL)
+    trace = request.args.get('trace') == '1'
+    if not search_query or selected_model not in BACKENDS:
+        return Response(sse('error', {'message': 'Missing search query or unknown model.'}), mimetype='text/event-stream', status=400)
+
+    events = queue.Queue()
+
+    def on_event(event, data):
+        events.put((event, data))
 
-        with open('Finalsummary.txt', 'r', encoding='utf-8') as file:
-            final_summary_text = file.read()
+    future = asyncio.run_coroutine_threadsafe(run_query(selected_model, search_query, on_event=on_event, run_id=new_run_id(), trace=trace), get_loop())
+    future.add_done_callback(lambda _: events.put(None))
 
-        with open('Finalsummary.txt', 'w', encoding='utf-8'):
-            pass
+    def generate():
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield sse(*item)
 
-        return render_template('index.html', final_summary=final_summary_text, selected_model=selected_model, search_query=search_query)
+            if future.cancelled() or future.exception() is not None:
+                error = None if future.cancelled() else future.exception()
+                message = str(error) if isinstance(error, QueryFailed) else 'The search could not be completed.'
+                yield sse('error', {'message': message})
+            else:
+                yield sse('done', {'final_summary': future.result()})
+        finally:
+            # The client went away before the pipeline finished.
+            if not future.done():
+                future.cancel()
 
-    return render_template('index.html', selected_model=selected_model, search_query=search_query)
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5005)
+    # Warmed in the background so the first query does not pay for it.
+    asyncio.run_coroutine_threadsafe(warm_backends(), get_loop())
+    # Queries share no files, so requests can be served concurrently.
+    app.run(debug=True, port=5005, threaded=True)
@@ -0,0 +1,96 @@
+import settings  # noqa: F401 (loads .env; must come first)
+
+from quart import Quart, Response, render_template, request
+from http_session import close_session
+from metrics import render as render_metrics
+from parsing import shutdown_executor
+from pipeline import QueryFailed
+from workspace import new_run_id
+from backends import BACKENDS, DEFAULT_MODEL, MODELS, SSE_KEEPALIVE_SECONDS, run_query, sse, warm_backends
+import asyncio
+
+# Async serving mode: every query runs as a task on the server's event loop,
+# so concurrency is bounded by I/O rather than by worker threads.
+# Run with: hypercorn asgi:app --bind 127.0.0.1:5005
+app = Quart(__name__)
+
+@app.before_serving
+async def startup():
+    await warm_backends()
+
+@app.after_serving
+async def shutdown():
+    await close_session()
+    shutdown_executor()
+
+@app.route('/', methods=['GET', 'POST'])
+async def index():
+    selected_model = DEFAULT_MODEL
+    search_query = ''
+
+    if request.method == 'POST':
+        form = await request.form
+        search_query = form.get('search_query', '')
+        selected_model = form.get('model', DEFAULT_MODEL)
+        if not search_query or selected_model not in BACKENDS:
+            return await render_template('index.html', models=MODELS, final_summary='Missing search query or unknown model.', selected_model=DEFAULT_MODEL, search_query=search_query), 400
+
+        try:
+            final_summary = await run_query(selected_model, search_query, run_id=new_run_id())
+        except QueryFailed as e:
+            final_summary = str(e)
+
+        return await render_template('index.html', models=MODELS, final_summary=final_summary, selected_model=selected_model, search_query=search_query)
+
+    return await render_template('index.html', models=MODELS, selected_model=selected_model, search_query=search_query)
+
+@app.route('/metrics')
+async def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stream')
+async def stream():
+    search_query = request.args.get('search_query', '')
+    selected_model = request.args.get('model', DEFAULT_MODEL)
+    trace = request.args.get('trace') == '1'
+    if not search_query or selected_model not in BACKENDS:
+        return Response(sse('error', {'message': 'Missing search query or unknown model.'}), mimetype='text/event-stream', status=400)
+
+    events = asyncio.Queue()
+
+    def on_event(event, data):
+        events.put_nowait((event, data))
+
+    task = asyncio.create_task(run_query(selected_model, search_query, on_event=on_event, run_id=new_run_id(), trace=trace))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+
+    async def generate():
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(events.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield sse(*item)
+
+            if task.cancelled() or task.exception() is not None:
+                error = None if task.cancelled() else task.exception()
+                message = str(error) if isinstance(error, QueryFailed) else 'The search could not be completed.'
+                yield sse('error', {'message': message})
+            else:
+                yield sse('done', {'final_summary': task.result()})
+        finally:
+            # The client went away before the pipeline finished.
+            if not task.done():
+                task.cancel()
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    response = Response(generate(), mimetype='text/event-stream', headers=headers)
+    response.timeout = None
+    return response
+
+if __name__ == '__main__':
+    app.run(port=5005)
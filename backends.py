@@ -0,0 +1,64 @@
+import functools
+import json
+import logging
+import os
+import time
+
+import pipeline
+from metrics import process_uptime, startup_seconds
+from parsing import warm_executor
+from providers import PROVIDERS, get_provider
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = list(PROVIDERS)
+MODELS = [(name, provider.label) for name, provider in PROVIDERS.items()]
+# Selected by default and the only provider warmed at startup; the others
+# are set up when first used.
+DEFAULT_MODEL = os.environ.get('QPAL_MODEL', 'bedrock')
+
+SSE_KEEPALIVE_SECONDS = 15
+
+# Identical queries submitted while one is running share its pipeline; the
+# later callers get the earlier events replayed and then follow along.
+query_flight = SingleFlight('query', events=True)
+
+
+async def warm_backends(models=(DEFAULT_MODEL,)):
+    # Called once the event loop is running, so loop-bound clients are built
+    # on the loop that will use them.
+    startup_seconds.set(process_uptime() or 0, step='imports')
+    for selected_model in models:
+        start = time.perf_counter()
+        try:
+            await get_provider(selected_model).warm()
+        except Exception as e:
+            # Left to fail, with the real error, on the first query instead.
+            logger.warning("Could not set up %s at startup: %s", selected_model, e)
+            continue
+        startup_seconds.set(round(time.perf_counter() - start, 3), step=f'provider_{selected_model}')
+    warm_executor()
+    ready = process_uptime()
+    if ready is not None:
+        startup_seconds.set(ready, step='ready')
+        logger.info("Ready %.2fs after process start (%s warmed).", ready, ', '.join(models))
+
+
+def query_key(selected_model, search_query):
+    return selected_model, ' '.join(search_query.lower().split())
+
+
+async def run_query(selected_model, search_query, on_event=None, run_id=None, trace=False, page_memo=None):
+    run = functools.partial(
+        pipeline.main, search_query, get_provider(selected_model),
+        run_id=run_id, trace=trace, page_memo=page_memo
+    )
+    if trace:
+        # A trace describes one caller's own run, so it is never shared.
+        return await run(on_event=on_event)
+    return await query_flight.do(query_key(selected_model, search_query), run, on_event=on_event)
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from backends import BACKENDS, run_query
+from llm_dispatcher import budget
+from pipeline import PageMemo
+from workspace import new_run_id
+
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+
+
+def query_key(item):
+    return str(item.get('id', item['query']))
+
+
+def read_queries(path):
+    # One JSON object per line with a "query" and optionally an "id" and a
+    # "model"; a bare JSON string is taken as the query.
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {'query': item}
+            if not item.get('query'):
+                raise ValueError(f"{path}:{line_number}: missing \"query\"")
+            yield item
+
+
+def load_checkpoint(path):
+    # The output file is the checkpoint: every query with a successful result
+    # line is done. A line cut short by a crash is ignored.
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('error') is None:
+                done.add(record['key'])
+    return done
+
+
+def open_output(path):
+    output = open(path, 'a+', encoding='utf-8')
+    output.seek(0, os.SEEK_END)
+    if output.tell():
+        output.seek(output.tell() - 1)
+        if output.read(1) != '\n':
+            # Finish the partial line left by a crash so the next record parses.
+            output.write('\n')
+    return output
+
+
+async def run_batch(input_path, output_path, model, concurrency=BATCH_CONCURRENCY, budget_limit=0):
+    done = load_checkpoint(output_path)
+    if budget_limit:
+        budget.limit = budget_limit
+    page_memo = PageMemo()
+    pending = asyncio.Queue()
+    skipped = 0
+    for item in read_queries(input_path):
+        key = query_key(item)
+        if key in done:
+            skipped += 1
+            continue
+        done.add(key)
+        pending.put_nowait(item)
+    logger.info("Batch: %s queries to run, %s already done.", pending.qsize(), skipped)
+
+    output = open_output(output_path)
+    completed = 0
+
+    async def run_one(item):
+        selected_model = item.get('model', model)
+        urls = []
+
+        def on_event(event, data):
+            if event == 'links':
+                urls.extend(data['urls'])
+
+        run_id = new_run_id()
+        start = time.time()
+        record = {'key': query_key(item), 'id': item.get('id'), 'query': item['query'], 'model': selected_model, 'run_id': run_id}
+        try:
+            if selected_model not in BACKENDS:
+                raise ValueError(f"Unknown model {selected_model!r}")
+            record['final_summary'] = await run_query(selected_model, item['query'], on_event=on_event, run_id=run_id, page_memo=page_memo)
+            # Model calls that fail after their retries return "" rather than
+            # raise; an empty answer must stay retryable, not be checkpointed.
+            if not record['final_summary'].strip():
+                raise ValueError("No final summary was produced")
+            record['error'] = None
+        except Exception as e:
+            logger.error("Query %r failed: %s", item['query'], e)
+            record['error'] = str(e)
+        record['urls'] = urls
+        record['seconds'] = round(time.time() - start, 2)
+        return record
+
+    async def worker():
+        nonlocal completed
+        while True:
+            try:
+                item = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            record = await run_one(item)
+            # Written and synced one line at a time, so a crash loses at most
+            # the queries that were still running.
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+            os.fsync(output.fileno())
+            completed += 1
+            logger.info("Batch: %s queries finished.", completed)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        output.close()
+    return completed
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+
+from aiohttp import web
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+PARAGRAPH = re.compile(rb'<p>.*?</p>', re.DOTALL)
+
+
+def load_corpus(directory=CORPUS_DIR):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.html'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                corpus.append(f.read())
+    return corpus
+
+
+def pad_page(html, size):
+    # Repeat the page's paragraphs inside <body> until it reaches size bytes,
+    # so page size can be varied without collecting more pages.
+    if len(html) >= size:
+        return html
+    paragraphs = PARAGRAPH.findall(html)
+    if not paragraphs:
+        return html
+    filler = []
+    length = len(html)
+    i = 0
+    while length < size:
+        # Vary each copy so cross-page deduplication does not remove it.
+        paragraph = paragraphs[i % len(paragraphs)].replace(b'<p>', f'<p>[{i}] '.encode('ascii'), 1)
+        filler.append(paragraph)
+        length += len(paragraph)
+        i += 1
+    return html.replace(b'</body>', b'\n'.join(filler) + b'\n</body>', 1)
+
+
+class FixtureServer:
+    # Local stand-in for the web: a SearXNG-compatible /search endpoint that
+    # returns links to /page/<key>, and pages drawn from the saved corpus with
+    # configurable latency, size and failure rate. Everything is seeded, so a
+    # given URL always behaves the same way within and across runs.
+    def __init__(self, latency=0.1, jitter=0.5, page_size=20000, failure_rate=0.0, results=10, seed=0,
+                 host='127.0.0.1', port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.failure_rate = failure_rate
+        self.results = results
+        self.seed = seed
+        self.host = host
+        self.port = port
+        self.corpus = load_corpus()
+        self.requests = 0
+        self.runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def rng(self, key):
+        digest = hashlib.sha256(f"{self.seed}:{key}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    async def search(self, request):
+        # Only the first result page has results, as with a small index.
+        if request.query.get('pageno', '1') != '1':
+            return web.json_response({'results': []})
+        query_key = hashlib.sha256(request.query.get('q', '').encode('utf-8')).hexdigest()[:12]
+        results = [{'url': f"{self.url}/page/{query_key}-{i}"} for i in range(self.results)]
+        return web.json_response({'results': results})
+
+    async def page(self, request):
+        self.requests += 1
+        key = request.match_info['key']
+        rng = self.rng(key)
+        delay = self.latency * (1 + rng.uniform(-self.jitter, self.jitter))
+        await asyncio.sleep(max(0.0, delay))
+        if rng.random() < self.failure_rate:
+            raise web.HTTPInternalServerError()
+        html = pad_page(self.corpus[rng.randrange(len(self.corpus))], self.page_size)
+        html = html.replace(b'<main>', f'<main><p>Fixture page {key}.</p>'.encode('ascii'), 1)
+        return web.Response(body=html, content_type='text/html')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/search', self.search)
+        app.router.add_get('/page/{key}', self.page)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,34 @@
+import asyncio
+
+from providers import LLMProvider
+
+
+class MockProvider(LLMProvider):
+    # Offline stand-in for a model API. A call waits first_token_latency, then
+    # produces output at tokens_per_second; the "summary" is the start of the
+    # input, so output size tracks input size the way real summaries roughly do.
+    name = 'mock'
+    label = 'Mock'
+
+    def __init__(self, tokens_per_second=100.0, first_token_latency=0.3, output_tokens=200, context_tokens=16000):
+        super().__init__('mock', {'max_tokens': output_tokens}, context_tokens)
+        self.tokens_per_second = tokens_per_second
+        self.first_token_latency = first_token_latency
+        self.output_tokens = output_tokens
+        self.calls = 0
+
+    def reply(self, content):
+        return ' '.join(content.split()[:self.output_tokens])
+
+    async def complete(self, prompt, content):
+        self.calls += 1
+        text = self.reply(content)
+        await asyncio.sleep(self.first_token_latency + self.count_tokens(text) / self.tokens_per_second)
+        return text
+
+    async def stream(self, prompt, content):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+        for word in self.reply(content).split():
+            await asyncio.sleep(self.count_tokens(word) / self.tokens_per_second)
+            yield word + ' '
@@ -0,0 +1,207 @@
+"""Offline end-to-end benchmark for the query pipeline.
+
+Runs real queries through pipeline.main() against a local fixture server
+(search results and pages) and a mock LLM provider, so it needs no network
+access or API keys:
+
+    python -m benchmarks.run --queries 20 --concurrency 1,4 --json bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.2
+
+Reports end-to-end and per-stage p50/p95/p99, throughput at each concurrency
+level and peak RSS. With --baseline the run exits non-zero when end-to-end p95
+regresses by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=10, help='queries per concurrency level')
+    parser.add_argument('--concurrency', default='1,4', help='comma-separated concurrent query counts')
+    parser.add_argument('--results', type=int, default=10, help='search results per query')
+    parser.add_argument('--latency', type=float, default=0.1, help='mean page latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.5, help='latency jitter as a fraction of --latency')
+    parser.add_argument('--page-size', type=int, default=20000, help='page size in bytes')
+    parser.add_argument('--failure-rate', type=float, default=0.1, help='fraction of pages answering 500')
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help='mock LLM output rate')
+    parser.add_argument('--first-token-latency', type=float, default=0.2, help='mock LLM latency before output starts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warm', action='store_true', help='keep the page, summary and search caches and the corpus index enabled')
+    parser.add_argument('--json', help='write the report to this file')
+    parser.add_argument('--baseline', help='report from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative p95 regression')
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    # Must run before the pipeline modules are imported: they read their
+    # settings at import time.
+    os.environ.setdefault('SEARCH_BACKEND', 'searxng')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # Every fixture page is served from one host, so the per-host connection
+    # cap would otherwise be the only thing being measured.
+    os.environ.setdefault('HTTP_MAX_CONNECTIONS_PER_HOST', '0')
+    # Never the real cache directory, so fixture pages cannot end up in the
+    # corpus index that cache-first queries are answered from.
+    os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='qpal-bench-'))
+    if not args.warm:
+        for name in ('PAGE_CACHE_ENABLED', 'SUMMARY_CACHE_ENABLED', 'SEARCH_CACHE_ENABLED', 'CORPUS_INDEX_ENABLED'):
+            os.environ.setdefault(name, '0')
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile; good enough for benchmark summaries.
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def distribution(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+    }
+
+
+def peak_rss_mb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+async def run_level(pipeline, provider, concurrency, queries, offset):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    spans = {}
+    failures = 0
+
+    async def run_one(i):
+        nonlocal failures
+        traces = []
+
+        def on_event(event, data):
+            if event == 'trace':
+                traces.append(data)
+
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await pipeline.main(f"benchmark query {offset + i}", provider, on_event=on_event, trace=True)
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+        for trace in traces:
+            for recorded in trace['spans']:
+                spans.setdefault(recorded['stage'], []).append(recorded['duration'])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_one(i) for i in range(queries)))
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'queries': queries,
+        'failures': failures,
+        'seconds': round(elapsed, 3),
+        'throughput_qps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'end_to_end': distribution(latencies),
+        'stages': {stage: distribution(durations) for stage, durations in sorted(spans.items())},
+    }
+
+
+async def benchmark(args):
+    from benchmarks.fixtures import FixtureServer
+    from benchmarks.mock_llm import MockProvider
+    from http_session import close_session
+    from parsing import shutdown_executor
+
+    server = await FixtureServer(
+        latency=args.latency, jitter=args.jitter, page_size=args.page_size,
+        failure_rate=args.failure_rate, results=args.results, seed=args.seed
+    ).start()
+    os.environ['SEARXNG_URL'] = server.url
+    import pipeline
+
+    provider = MockProvider(tokens_per_second=args.tokens_per_second, first_token_latency=args.first_token_latency)
+    levels = []
+    try:
+        offset = 0
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            levels.append(await run_level(pipeline, provider, concurrency, args.queries, offset))
+            offset += args.queries
+    finally:
+        await close_session()
+        await server.stop()
+        shutdown_executor()
+
+    return {
+        'settings': {key: value for key, value in vars(args).items() if key not in ('json', 'baseline')},
+        'levels': levels,
+        'page_requests': server.requests,
+        'llm_calls': provider.calls,
+        'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+        'peak_child_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def format_seconds(value):
+    return '-' if value is None else f"{value:.3f}s"
+
+
+def print_report(report):
+    for level in report['levels']:
+        print(f"\nconcurrency={level['concurrency']}  queries={level['queries']}  failures={level['failures']}  "
+              f"wall={level['seconds']}s  throughput={level['throughput_qps']} queries/s")
+        rows = [('end-to-end', level['end_to_end'])] + list(level['stages'].items())
+        print(f"  {'stage':<12}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for stage, stats in rows:
+            print(f"  {stage:<12}{stats['count']:>7}{format_seconds(stats['p50']):>10}"
+                  f"{format_seconds(stats['p95']):>10}{format_seconds(stats['p99']):>10}")
+    print(f"\npage requests={report['page_requests']}  llm calls={report['llm_calls']}  "
+          f"peak RSS={report['peak_rss_mb']} MB (parse workers {report['peak_child_rss_mb']} MB)")
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    previous = {level['concurrency']: level for level in baseline['levels']}
+    for level in report['levels']:
+        before = previous.get(level['concurrency'])
+        if before is None or not before['end_to_end']['p95'] or level['end_to_end']['p95'] is None:
+            continue
+        ratio = level['end_to_end']['p95'] / before['end_to_end']['p95']
+        if ratio > 1 + tolerance:
+            found.append(f"concurrency={level['concurrency']}: end-to-end p95 "
+                         f"{before['end_to_end']['p95']:.3f}s -> {level['end_to_end']['p95']:.3f}s")
+    return found
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_environment(args)
+    report = asyncio.run(benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
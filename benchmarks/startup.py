@@ -0,0 +1,94 @@
+"""Cold-start and per-call setup benchmark.
+
+Imports each entry point in fresh interpreters and times it, then times how
+long each provider takes to construct and warm its client on first use and
+what the same setup costs on later calls, once everything is cached:
+
+    python -m benchmarks.startup --runs 5 --json startup.json
+
+Needs no network access or API keys; clients are built but never used.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ('providers', 'pipeline', 'app', 'asgi', 'qpal')
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per entry point')
+    parser.add_argument('--calls', type=int, default=1000, help='calls timed for the per-call setup cost')
+    parser.add_argument('--json', help='write the report to this file')
+    return parser.parse_args(argv)
+
+
+def import_seconds(module, runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET.format(module=module)],
+            cwd=root, capture_output=True, text=True, env={**os.environ, 'LOG_LEVEL': 'WARNING'}
+        )
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return {'median': round(statistics.median(timings), 4), 'min': round(min(timings), 4)}
+
+
+async def provider_setup(calls):
+    from providers import PROVIDERS, get_provider
+
+    report = {}
+    for name in PROVIDERS:
+        start = time.perf_counter()
+        try:
+            provider = get_provider(name)
+            await provider.warm()
+        except Exception as e:
+            report[name] = {'error': str(e)}
+            continue
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(calls):
+            await get_provider(name).warm()
+        report[name] = {'first_seconds': round(first, 4), 'per_call_microseconds': round((time.perf_counter() - start) / calls * 1e6, 2)}
+    return report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # SDK clients refuse to be built without credentials; these are never sent.
+    for name, value in (('ANTHROPIC_API_KEY', 'benchmark'), ('OPENAI_API_KEY', 'benchmark'), ('AWS_REGION', 'us-east-1')):
+        os.environ.setdefault(name, value)
+    report = {
+        'imports': {module: import_seconds(module, args.runs) for module in ENTRY_POINTS},
+        'providers': asyncio.run(provider_setup(args.calls)),
+    }
+    print(f"{'import':<12}{'median':>10}{'min':>10}")
+    for module, stats in report['imports'].items():
+        if 'error' in stats:
+            print(f"{module:<12}  {stats['error']}")
+        else:
+            print(f"{module:<12}{stats['median']:>9.3f}s{stats['min']:>9.3f}s")
+    print(f"\n{'provider':<12}{'first use':>12}{'later calls':>14}")
+    for name, stats in report['providers'].items():
+        if 'error' in stats:
+            print(f"{name:<12}  {stats['error']}")
+        else:
+            print(f"{name:<12}{stats['first_seconds']:>11.3f}s{stats['per_call_microseconds']:>12.2f}us")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
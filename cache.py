@@ -0,0 +1,256 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from metrics import summary_cache_lookups
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 3600))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+SUMMARY_CACHE_ENABLED = os.environ.get('SUMMARY_CACHE_ENABLED', '1') == '1'
+SUMMARY_CACHE_MAX_ENTRIES = int(os.environ.get('SUMMARY_CACHE_MAX_ENTRIES', 10000))
+SUMMARY_CACHE_MAX_AGE = int(os.environ.get('SUMMARY_CACHE_MAX_AGE', 7 * 24 * 3600))
+SEARCH_CACHE_ENABLED = os.environ.get('SEARCH_CACHE_ENABLED', '1') == '1'
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 24 * 3600))
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname.lower() if parts.hostname else ''
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        netloc = f"{netloc}:{parts.port}"
+    path = parts.path or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def hash_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    # Small SQLite-backed store shared by the event loop and executor threads.
+    # Subclasses provide the table schema via create_statements.
+    create_statements = ()
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.row_factory = sqlite3.Row
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.create_statements:
+                self._connection.execute(statement)
+        return self._connection
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class PageCache(SQLiteCache):
+    create_statements = (
+        '''CREATE TABLE IF NOT EXISTS pages (
+            key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            content TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            size INTEGER NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)',
+    )
+
+    def __init__(self, path, ttl=PAGE_CACHE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, url):
+        key = hash_key(normalize_url(url))
+        rows = self.execute('SELECT * FROM pages WHERE key = ?', (key,))
+        if not rows:
+            return None
+        self.execute('UPDATE pages SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return dict(rows[0])
+
+    def is_fresh(self, entry):
+        return time.time() - entry['fetched_at'] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, content, etag=None, last_modified=None):
+        normalized_url = normalize_url(url)
+        now = time.time()
+        self.execute(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (hash_key(normalized_url), normalized_url, content, etag, last_modified, now, now, len(content.encode('utf-8')))
+        )
+        self.evict()
+
+    def touch(self, url):
+        # The origin answered 304 Not Modified: the cached copy is fresh again.
+        now = time.time()
+        self.execute('UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE key = ?', (now, now, hash_key(normalize_url(url))))
+
+    def evict(self):
+        total = self.execute('SELECT COALESCE(SUM(size), 0) FROM pages')[0][0]
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for row in self.execute('SELECT key, size FROM pages ORDER BY accessed_at'):
+            if total <= self.max_bytes:
+                break
+            self.execute('DELETE FROM pages WHERE key = ?', (row['key'],))
+            total -= row['size']
+            removed += 1
+        logger.info("Evicted %s pages from the page cache.", removed)
+
+
+class SummaryCache(SQLiteCache):
+    create_statements = (
+        '''CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at)',
+    )
+
+    def __init__(self, path, max_entries=SUMMARY_CACHE_MAX_ENTRIES, max_age=SUMMARY_CACHE_MAX_AGE):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+    def key(self, content, prompt, model, params):
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return hash_key(content_hash, prompt, model, json.dumps(params, sort_keys=True))
+
+    def get(self, content, prompt, model, params):
+        key = self.key(content, prompt, model, params)
+        rows = self.execute('SELECT summary FROM summaries WHERE key = ? AND created_at >= ?', (key, time.time() - self.max_age))
+        if not rows:
+            summary_cache_lookups.inc(result='miss')
+            return None
+        summary_cache_lookups.inc(result='hit')
+        self.execute('UPDATE summaries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return rows[0]['summary']
+
+    def put(self, content, prompt, model, params, summary):
+        now = time.time()
+        self.execute(
+            'INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)',
+            (self.key(content, prompt, model, params), summary, now, now)
+        )
+        self.evict()
+
+    def evict(self):
+        self.execute('DELETE FROM summaries WHERE created_at < ?', (time.time() - self.max_age,))
+        count = self.execute('SELECT COUNT(*) FROM summaries')[0][0]
+        if count > self.max_entries:
+            self.execute(
+                'DELETE FROM summaries WHERE key IN (SELECT key FROM summaries ORDER BY accessed_at LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+
+class SearchCache(SQLiteCache):
+    create_statements = (
+        '''CREATE TABLE IF NOT EXISTS searches (
+            key TEXT PRIMARY KEY,
+            urls TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )''',
+    )
+
+    def __init__(self, path, ttl=SEARCH_CACHE_TTL):
+        super().__init__(path)
+        self.ttl = ttl
+
+    def key(self, backend, query, num_results):
+        return hash_key(backend, ' '.join(query.lower().split()), num_results)
+
+    def get(self, backend, query, num_results):
+        rows = self.execute(
+            'SELECT urls FROM searches WHERE key = ? AND created_at >= ?',
+            (self.key(backend, query, num_results), time.time() - self.ttl)
+        )
+        return json.loads(rows[0]['urls']) if rows else None
+
+    def put(self, backend, query, num_results, urls):
+        now = time.time()
+        self.execute('DELETE FROM searches WHERE created_at < ?', (now - self.ttl,))
+        self.execute(
+            'INSERT OR REPLACE INTO searches VALUES (?, ?, ?)',
+            (self.key(backend, query, num_results), json.dumps(urls), now)
+        )
+
+
+page_cache = PageCache(os.path.join(CACHE_DIR, 'pages.db')) if PAGE_CACHE_ENABLED else None
+summary_cache = SummaryCache(os.path.join(CACHE_DIR, 'summaries.db')) if SUMMARY_CACHE_ENABLED else None
+search_cache = SearchCache(os.path.join(CACHE_DIR, 'searches.db')) if SEARCH_CACHE_ENABLED else None
+
+
+async def memoized_summary(content, prompt, model, params, summarize):
+    # summarize() is only awaited on a cache miss; empty (failed) summaries are not stored.
+    if summary_cache is not None:
+        summary = summary_cache.get(content, prompt, model, params)
+        if summary is not None:
+            return summary
+    summary = await summarize()
+    if summary and summary_cache is not None:
+        summary_cache.put(content, prompt, model, params, summary)
+    return summary
+
+
+async def memoized_summary_stream(content, prompt, model, params, stream):
+    # Streaming counterpart of memoized_summary: a hit is yielded as a single chunk.
+    if summary_cache is not None:
+        summary = summary_cache.get(content, prompt, model, params)
+        if summary is not None:
+            yield summary
+            return
+    chunks = []
+    async for text in stream():
+        chunks.append(text)
+        yield text
+    summary = ''.join(chunks)
+    if summary and summary_cache is not None:
+        summary_cache.put(content, prompt, model, params, summary)
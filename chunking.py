@@ -0,0 +1,74 @@
+import os
+import re
+
+from providers import APPROX_CHARS_PER_TOKEN
+
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', 8000))
+PAGE_MAX_TOKENS = int(os.environ.get('PAGE_MAX_TOKENS', 25000))
+PACK_MAX_TOKENS = int(os.environ.get('PACK_MAX_TOKENS', 2000))
+PROMPT_OVERHEAD_TOKENS = 500
+
+PARAGRAPH_BOUNDARY = re.compile(r'\n\s*\n')
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_words(text, max_tokens):
+    # Last resort for a single sentence longer than the budget.
+    max_chars = max_tokens * APPROX_CHARS_PER_TOKEN
+    piece = []
+    length = 0
+    for word in text.split():
+        if piece and length + len(word) + 1 > max_chars:
+            yield ' '.join(piece)
+            piece = []
+            length = 0
+        piece.append(word)
+        length += len(word) + 1
+    if piece:
+        yield ' '.join(piece)
+
+
+def iter_pieces(text, max_tokens, count_tokens):
+    for paragraph in PARAGRAPH_BOUNDARY.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in SENTENCE_BOUNDARY.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                yield sentence
+            else:
+                yield from split_words(sentence, max_tokens)
+
+
+def pack_texts(texts, max_tokens, count_tokens, separator='\n\n'):
+    # Greedily group consecutive texts so each group fits in max_tokens.
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return [separator.join(group) for group in groups]
+
+
+def split_text(text, max_tokens, count_tokens):
+    # Split on paragraph, then sentence, then word boundaries into chunks of
+    # at most max_tokens each.
+    return pack_texts(iter_pieces(text, max_tokens, count_tokens), max_tokens, count_tokens)
+
+
+def chunk_budget(provider):
+    # Input tokens available to one call: small chunks keep each call fast,
+    # and the model's context must still hold the prompt and the output.
+    available = provider.context_tokens - provider.params.get('max_tokens', 0) - PROMPT_OVERHEAD_TOKENS
+    return max(1, min(CHUNK_MAX_TOKENS, available))
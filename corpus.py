@@ -0,0 +1,108 @@
+import logging
+import os
+import time
+
+from cache import CACHE_DIR, SQLiteCache
+from dedupe import url_key
+from relevance import query_terms
+
+logger = logging.getLogger(__name__)
+
+CORPUS_INDEX_ENABLED = os.environ.get('CORPUS_INDEX_ENABLED', '1') == '1'
+# 'live' always searches the web; 'cache_first' answers from indexed pages
+# first and only searches for the results still missing.
+CORPUS_MODE = os.environ.get('CORPUS_MODE', 'live')
+CORPUS_MAX_AGE = int(os.environ.get('CORPUS_MAX_AGE', 7 * 24 * 3600))
+# In cache_first mode the web is only searched when fewer indexed pages than
+# this match (0: fewer than a full set of search results).
+CORPUS_MIN_PAGES = int(os.environ.get('CORPUS_MIN_PAGES', 0))
+
+
+def page_title(plaintext):
+    first_line = plaintext.split('\n', 1)[0]
+    return first_line[len('Title: '):].strip() if first_line.startswith('Title: ') else ''
+
+
+class CorpusIndex(SQLiteCache):
+    # Every page scraped in the last CORPUS_MAX_AGE seconds, with its latest
+    # summary, in a full-text index: the local corpus that cache-first queries
+    # are answered from. Older pages could never be returned, so they are
+    # pruned as new ones arrive.
+    create_statements = (
+        '''CREATE TABLE IF NOT EXISTS documents (
+            key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            summary TEXT,
+            summary_scope TEXT,
+            fetched_at REAL NOT NULL
+        )''',
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            key UNINDEXED, title, content, tokenize = 'porter unicode61'
+        )''',
+        'CREATE INDEX IF NOT EXISTS documents_fetched_at ON documents (fetched_at)',
+    )
+
+    def __init__(self, path, max_age=CORPUS_MAX_AGE):
+        super().__init__(path)
+        self.max_age = max_age
+
+    def put(self, url, content):
+        key = url_key(url)
+        title = page_title(content)
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN')
+            try:
+                connection.execute(
+                    '''INSERT INTO documents (key, url, title, content, fetched_at) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT (key) DO UPDATE SET url = excluded.url, title = excluded.title,
+                       content = excluded.content, fetched_at = excluded.fetched_at,
+                       summary = CASE WHEN documents.content = excluded.content THEN documents.summary END,
+                       summary_scope = CASE WHEN documents.content = excluded.content THEN documents.summary_scope END''',
+                    (key, url, title, content, time.time())
+                )
+                connection.execute('DELETE FROM documents_fts WHERE key = ?', (key,))
+                connection.execute('INSERT INTO documents_fts (key, title, content) VALUES (?, ?, ?)', (key, title, content))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        self.evict()
+
+    def evict(self):
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN')
+            try:
+                connection.execute(
+                    'DELETE FROM documents_fts WHERE key IN (SELECT key FROM documents WHERE fetched_at < ?)', (cutoff,)
+                )
+                connection.execute('DELETE FROM documents WHERE fetched_at < ?', (cutoff,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def set_summary(self, url, summary, scope=''):
+        # scope is the query a focused summary was written for ('' if none).
+        self.execute('UPDATE documents SET summary = ?, summary_scope = ? WHERE key = ?', (summary, scope, url_key(url)))
+
+    def search(self, query, limit, max_age=None):
+        # Pages containing every query term (after stemming), best match first.
+        terms = query_terms(query)
+        if not terms or limit <= 0:
+            return []
+        match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self.execute(
+            '''SELECT documents.* FROM documents_fts JOIN documents ON documents.key = documents_fts.key
+               WHERE documents_fts MATCH ? AND documents.fetched_at >= ?
+               ORDER BY bm25(documents_fts, 0, 2.0, 1.0) LIMIT ?''',
+            (match, time.time() - (self.max_age if max_age is None else max_age), limit)
+        )
+        return [dict(row) for row in rows]
+
+
+corpus_index = CorpusIndex(os.path.join(CACHE_DIR, 'corpus.db')) if CORPUS_INDEX_ENABLED else None
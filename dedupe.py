@@ -0,0 +1,159 @@
+import hashlib
+import os
+import re
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from.
+TRACKING_PARAMS = re.compile(
+    r'^(?:utm_\w+|fbclid|gclid|dclid|gbraid|wbraid|msclkid|yclid|mc_cid|mc_eid|igshid|_ga|_gl|'
+    r'ref_src|ref_url|spm)$',
+    re.IGNORECASE
+)
+# Parameters that select a variant of the same article. The variant is still
+# what gets fetched, since not every site serves the page without them.
+VARIANT_PARAMS = ('amp',)
+# Hosts whose pages are video players, feeds or login walls rather than text.
+SKIP_DOMAINS = (
+    'youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion.com', 'tiktok.com', 'twitch.tv',
+    'facebook.com', 'instagram.com', 'twitter.com', 'x.com', 'linkedin.com', 'pinterest.com', 'threads.net'
+) + tuple(domain.strip().lower() for domain in os.environ.get('URL_SKIP_DOMAINS', '').split(',') if domain.strip())
+NON_HTML_EXTENSIONS = (
+    '.pdf', '.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx', '.odt', '.rtf', '.epub',
+    '.zip', '.gz', '.tar', '.rar', '.7z', '.exe', '.dmg', '.iso',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg',
+    '.mp3', '.m4a', '.wav', '.ogg', '.mp4', '.m4v', '.mov', '.avi', '.mkv', '.webm'
+)
+# Mirrors of an article on another host: Google's and the AMP project's caches.
+AMP_CACHE_PATH = re.compile(r'^/(?:amp/s/|c/s/)(.+)$')
+# story.amp.html is served as story.html, so that rewrite is safe to fetch.
+# Other AMP paths (/amp, .amp) are left alone, since plenty of ordinary pages
+# (/tags/amp) end that way too; real AMP copies are caught by their SimHash.
+AMP_HTML_SUFFIX = re.compile(r'\.amp\.html$')
+# Host labels of mobile and AMP editions, ignored when comparing URLs. The
+# original host is fetched: many sites serve only www, not the bare domain.
+MOBILE_LABELS = ('www', 'm', 'mobile', 'amp')
+
+# Pages whose fingerprints differ in at most this many of 64 bits are treated
+# as copies of each other; 0 turns near-duplicate detection off.
+NEAR_DUPLICATE_BITS = int(os.environ.get('NEAR_DUPLICATE_BITS', 3))
+SHINGLE_WORDS = 3
+
+
+def unwrap_amp_cache(parts):
+    host = parts.hostname or ''
+    match = AMP_CACHE_PATH.match(parts.path)
+    if match and (host.endswith('.cdn.ampproject.org') or host in ('google.com', 'www.google.com')):
+        return urlsplit('https://' + unquote(match.group(1)))
+    return parts
+
+
+def canonical_url(url):
+    # The URL to fetch: tracking parameters and fragments removed and AMP
+    # caches unwrapped. Scheme and host are kept since not every site serves
+    # every variant.
+    parts = unwrap_amp_cache(urlsplit(url.strip()))
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        netloc = f"{netloc}:{parts.port}"
+    path = AMP_HTML_SUFFIX.sub('.html', parts.path) or '/'
+    query = urlencode([(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not TRACKING_PARAMS.match(name)])
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def url_key(url):
+    # Identity of a page for deduplication: http/https, www, mobile and AMP
+    # hosts, variant parameters and a trailing slash do not make a different
+    # page.
+    parts = urlsplit(canonical_url(url))
+    labels = parts.netloc.split('.')
+    if len(labels) > 2:
+        labels = [label for label in labels[:-2] if label not in MOBILE_LABELS] + labels[-2:]
+    host = '.'.join(labels)
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if name.lower() not in VARIANT_PARAMS))
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+
+def skip_reason(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return 'not a web page'
+    host = (parts.hostname or '').lower()
+    if any(host == domain or host.endswith('.' + domain) for domain in SKIP_DOMAINS):
+        return 'video or social site'
+    if parts.path.lower().endswith(NON_HTML_EXTENSIONS):
+        return 'not HTML'
+    return None
+
+
+class UrlFilter:
+    # Per-query: canonicalizes search results and drops repeats and links that
+    # cannot be summarized, before any of them is fetched.
+    def __init__(self):
+        self.seen = set()
+        self.duplicates = 0
+        self.skipped = 0
+
+    def admit(self, url):
+        reason = skip_reason(url)
+        if reason is not None:
+            self.skipped += 1
+            return None, reason
+        key = url_key(url)
+        if key in self.seen:
+            self.duplicates += 1
+            return None, 'duplicate'
+        self.seen.add(key)
+        return canonical_url(url), None
+
+
+def simhash(text):
+    # 64-bit SimHash over word shingles: similar texts get fingerprints that
+    # differ in few bits, unlike a plain hash.
+    words = text.lower().split()
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+              for shingle in shingles]
+    threshold = len(hashes) / 2
+    # Count set bits per position by transposing the binary strings, which
+    # keeps the loop in C; bit 63 comes first.
+    columns = zip(*(format(value, '064b') for value in hashes))
+    fingerprint = 0
+    for column in columns:
+        fingerprint = (fingerprint << 1) | (column.count('1') > threshold)
+    return fingerprint
+
+
+class NearDuplicates:
+    # Fingerprints of the pages kept so far. Lookups are indexed by splitting
+    # the fingerprint into max_bits + 1 bands: two fingerprints within max_bits
+    # of each other must agree exactly on at least one band.
+    def __init__(self, max_bits=NEAR_DUPLICATE_BITS):
+        self.max_bits = max_bits
+        bands = max_bits + 1
+        self.bands = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        self.index = {}
+        self.dropped = 0
+
+    def band_keys(self, fingerprint):
+        for i, (start, end) in enumerate(self.bands):
+            yield i, (fingerprint >> start) & ((1 << (end - start)) - 1)
+
+    def check(self, url, text):
+        # Returns the URL of an earlier page this text nearly duplicates, or
+        # None after recording it as a page that was kept.
+        if not self.max_bits:
+            return None
+        fingerprint = simhash(text)
+        keys = list(self.band_keys(fingerprint))
+        for key in keys:
+            for other, other_url in self.index.get(key, ()):
+                if bin(fingerprint ^ other).count('1') <= self.max_bits:
+                    self.dropped += 1
+                    return other_url
+        for key in keys:
+            self.index.setdefault(key, []).append((fingerprint, url))
+        return None
@@ -0,0 +1,69 @@
+import logging
+import os
+
+import aiohttp
+
+from llm_dispatcher import LoopLocal
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', 100))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('HTTP_MAX_CONNECTIONS_PER_HOST', 8))
+HTTP_DNS_CACHE_TTL = int(os.environ.get('HTTP_DNS_CACHE_TTL', 300))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get('HTTP_KEEPALIVE_TIMEOUT', 30))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_TOTAL_TIMEOUT = float(os.environ.get('HTTP_TOTAL_TIMEOUT', 20))
+MAX_BODY_BYTES = int(os.environ.get('MAX_BODY_BYTES', 5 * 1024 * 1024))
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class BodyTooLarge(aiohttp.ClientError):
+    pass
+
+
+def create_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_MAX_CONNECTIONS,
+        limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=HTTP_TOTAL_TIMEOUT,
+        sock_connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT,
+    )
+    logger.info("Opened shared HTTP session.")
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+_sessions = LoopLocal(create_session)
+
+
+def get_session():
+    # One pooled session per event loop, reused by every scrape on that loop.
+    session = _sessions.get()
+    if session.closed:
+        _sessions.discard()
+        session = _sessions.get()
+    return session
+
+
+async def close_session():
+    session = _sessions.discard()
+    if session is not None and not session.closed:
+        await session.close()
+
+
+async def read_body(response, max_bytes=MAX_BODY_BYTES):
+    # Stream the body and give up as soon as it passes max_bytes, instead of
+    # buffering an arbitrarily large page first.
+    if response.content_length is not None and response.content_length > max_bytes:
+        raise BodyTooLarge(f"Content-Length {response.content_length} exceeds {max_bytes} bytes")
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            raise BodyTooLarge(f"Body exceeds {max_bytes} bytes")
+    return bytes(body)
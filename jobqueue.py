@@ -0,0 +1,233 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+import uuid
+
+from cache import CACHE_DIR, SQLiteCache
+from llm_dispatcher import LoopLocal
+
+# Distributed mode: with QPAL_QUEUE set, searches, page fetches and summarize
+# calls are enqueued for `qpal worker` processes instead of run in-process.
+QPAL_QUEUE = os.environ.get('QPAL_QUEUE', '')
+QPAL_QUEUE_PATH = os.environ.get('QPAL_QUEUE_PATH') or os.path.join(CACHE_DIR, 'jobs.db')
+JOB_TIMEOUT = float(os.environ.get('JOB_TIMEOUT', 600))
+# A claimed job whose worker has not reported back within the lease is handed
+# to another worker, up to JOB_MAX_ATTEMPTS times.
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 0.1))
+
+# Set inside workers, where jobs must run locally rather than be enqueued again.
+in_worker = contextvars.ContextVar('qpal_in_worker', default=False)
+# Run ID of the query on whose behalf jobs are enqueued.
+current_run_id = contextvars.ContextVar('qpal_run_id', default=None)
+
+
+class JobFailed(Exception):
+    pass
+
+
+class JobQueue:
+    # A queue backend stores jobs and their results. Subclasses implement the
+    # synchronous primitives below; a broker such as Redis can map them onto
+    # lists and hashes and override wait()/next_job() with blocking pops.
+    name = None
+
+    def __init__(self):
+        # One poller per event loop checks every outstanding job at once.
+        self._waiters = LoopLocal(dict)
+        self._pollers = LoopLocal(lambda: [None])
+
+    def submit(self, run_id, kind, payload):
+        raise NotImplementedError
+
+    def claim(self, kinds, worker):
+        # Atomically take the oldest queued job of one of these kinds.
+        raise NotImplementedError
+
+    def complete(self, job_id, result):
+        raise NotImplementedError
+
+    def fail(self, job_id, error):
+        raise NotImplementedError
+
+    def cancel(self, job_id):
+        raise NotImplementedError
+
+    def finished(self, job_ids):
+        # {job_id: (status, result, error)} for those of job_ids that are done or failed.
+        raise NotImplementedError
+
+    def purge(self, run_id, keep=()):
+        # Deletes the run's jobs except those in keep.
+        raise NotImplementedError
+
+    def waiting(self):
+        # Jobs someone in this event loop is still waiting on. A coalesced
+        # fetch or summarize job carries the run ID of the query that started
+        # it, so other queries may still need it after that query is done.
+        return set(self._waiters.get())
+
+    async def poll(self):
+        waiters = self._waiters.get()
+        while waiters:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            for job_id, (status, result, error) in self.finished(list(waiters)).items():
+                future = waiters.pop(job_id, None)
+                if future is None or future.done():
+                    continue
+                if status == 'done':
+                    future.set_result(result)
+                else:
+                    future.set_exception(JobFailed(error))
+
+    async def wait(self, job_id):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.get()[job_id] = future
+        poller = self._pollers.get()
+        if poller[0] is None or poller[0].done():
+            poller[0] = asyncio.create_task(self.poll())
+        return await future
+
+    async def call(self, kind, payload, timeout=JOB_TIMEOUT):
+        # Enqueue a job and wait for its result; cancelling the caller
+        # withdraws the job if no worker has taken it yet.
+        job_id = self.submit(current_run_id.get(), kind, payload)
+        try:
+            return await asyncio.wait_for(self.wait(job_id), timeout or None)
+        except BaseException:
+            self._waiters.get().pop(job_id, None)
+            self.cancel(job_id)
+            raise
+
+    async def next_job(self, kinds, worker):
+        while True:
+            job = self.claim(kinds, worker)
+            if job is not None:
+                return job
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+class SQLiteJobQueue(JobQueue, SQLiteCache):
+    # Built-in backend: a SQLite file shared by the web process and workers on
+    # one machine (or on a shared volume for a small cluster).
+    name = 'sqlite'
+    create_statements = (
+        '''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            run_id TEXT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at REAL NOT NULL,
+            leased_until REAL
+        )''',
+        'CREATE INDEX IF NOT EXISTS jobs_status_kind ON jobs (status, kind, created_at)',
+        'CREATE INDEX IF NOT EXISTS jobs_run_id ON jobs (run_id)',
+    )
+
+    def __init__(self, path=QPAL_QUEUE_PATH):
+        JobQueue.__init__(self)
+        SQLiteCache.__init__(self, path)
+
+    def submit(self, run_id, kind, payload):
+        job_id = uuid.uuid4().hex
+        self.execute(
+            "INSERT INTO jobs (id, run_id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, run_id, kind, json.dumps(payload), time.time())
+        )
+        return job_id
+
+    def claim(self, kinds, worker):
+        now = time.time()
+        marks = ','.join('?' * len(kinds))
+        with self._lock:
+            connection = self._connect()
+            # IMMEDIATE takes the write lock up front, so two workers can
+            # never claim the same job.
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                # Nobody waits longer than JOB_TIMEOUT, so older results are
+                # only left over from runs that ended abnormally.
+                connection.execute(
+                    "DELETE FROM jobs WHERE status IN ('done', 'failed') AND created_at < ?", (now - JOB_TIMEOUT,)
+                )
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker lost' "
+                    "WHERE status = 'running' AND leased_until < ? AND attempts >= ?",
+                    (now, JOB_MAX_ATTEMPTS)
+                )
+                row = connection.execute(
+                    f"SELECT * FROM jobs WHERE kind IN ({marks}) "
+                    "AND (status = 'queued' OR (status = 'running' AND leased_until < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (*kinds, now)
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, leased_until = ? WHERE id = ?",
+                        (worker, now + JOB_LEASE_SECONDS, row['id'])
+                    )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return {'id': row['id'], 'run_id': row['run_id'], 'kind': row['kind'], 'payload': json.loads(row['payload'])}
+
+    def complete(self, job_id, result):
+        self.execute(
+            "UPDATE jobs SET status = 'done', result = ? WHERE id = ? AND status = 'running'",
+            (json.dumps(result), job_id)
+        )
+
+    def fail(self, job_id, error):
+        self.execute("UPDATE jobs SET status = 'failed', error = ? WHERE id = ? AND status = 'running'", (error, job_id))
+
+    def cancel(self, job_id):
+        self.execute("DELETE FROM jobs WHERE id = ? AND status = 'queued'", (job_id,))
+
+    def finished(self, job_ids):
+        found = {}
+        # Stay under SQLite's limit on bound parameters.
+        for i in range(0, len(job_ids), 500):
+            batch = job_ids[i:i + 500]
+            rows = self.execute(
+                f"SELECT id, status, result, error FROM jobs WHERE id IN ({','.join('?' * len(batch))}) "
+                "AND status IN ('done', 'failed')",
+                batch
+            )
+            for row in rows:
+                found[row['id']] = (row['status'], json.loads(row['result']) if row['result'] is not None else None, row['error'])
+        return found
+
+    def purge(self, run_id, keep=()):
+        job_ids = [row['id'] for row in self.execute('SELECT id FROM jobs WHERE run_id = ?', (run_id,))
+                   if row['id'] not in keep]
+        for i in range(0, len(job_ids), 500):
+            batch = job_ids[i:i + 500]
+            self.execute(f"DELETE FROM jobs WHERE id IN ({','.join('?' * len(batch))})", batch)
+
+
+QUEUE_BACKENDS = {
+    backend.name: backend
+    for backend in (SQLiteJobQueue,)
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_job_queue(name=QPAL_QUEUE):
+    return QUEUE_BACKENDS[name]() if name else None
+
+
+def remote_queue():
+    # The queue to send work to, or None to run it here.
+    return None if in_worker.get() else get_job_queue()
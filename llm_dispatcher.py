@@ -0,0 +1,260 @@
+import asyncio
+import contextlib
+import email.utils
+import itertools
+import logging
+import os
+import random
+import time
+import weakref
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 5))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 5))
+LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 1))
+LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', 60))
+
+
+class LoopLocal:
+    # asyncio primitives and async SDK clients are bound to the loop that first
+    # uses them, so keep one instance per running event loop.
+    def __init__(self, factory):
+        self.factory = factory
+        self._values = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        value = self._values.get(loop)
+        if value is None:
+            value = self._values[loop] = self.factory()
+        return value
+
+    def discard(self):
+        return self._values.pop(asyncio.get_running_loop(), None)
+
+
+async def iterate_blocking(func, *args, **kwargs):
+    # Drive a blocking iterator (e.g. a boto3 event stream) on an executor
+    # thread and yield its items on the event loop as they arrive.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    finished = object()
+
+    def run():
+        try:
+            for item in func(*args, **kwargs):
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, finished)
+
+    future = loop.run_in_executor(None, run)
+    while True:
+        item = await queue.get()
+        if item is finished:
+            break
+        yield item
+    await future
+
+
+def parse_retry_after(headers):
+    # Seconds to wait from Retry-After (seconds or an HTTP date) or the
+    # retry-after-ms header some APIs send; None when absent or unparsable.
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (email.utils.parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    # Allows per_minute units per minute with bursts of up to a minute's worth.
+    # consume() may take the bucket below zero, which later acquires pay back.
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount):
+        self.refill()
+        self.tokens -= amount
+
+
+class AdaptiveLimit:
+    # AIMD concurrency limit: grows by one slot per limit's worth of successful
+    # calls and halves on throttling (at most once per cooldown, so a burst of
+    # 429s from calls that were already in flight counts as one signal).
+    def __init__(self, maximum, cooldown=1.0):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._condition = LoopLocal(asyncio.Condition)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        condition = self._condition.get()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+    def increase(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return
+        self.last_decrease = now
+        self.limit = max(1.0, self.limit / 2)
+        logger.warning("Throttled; LLM concurrency limit lowered to %s.", int(self.limit))
+
+
+class ConcurrencyBudget:
+    # Optional process-wide cap on in-flight I/O, shared by page fetches and
+    # LLM calls across every query. Unlimited unless a limit is set (batch
+    # mode sets one); 0 means unlimited.
+    def __init__(self, limit=0):
+        self.limit = limit
+        self._semaphore = LoopLocal(lambda: asyncio.Semaphore(self.limit))
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if not self.limit:
+            yield
+            return
+        async with self._semaphore.get():
+            yield
+
+
+class Lane:
+    # Limits for one provider: adaptive concurrency plus optional requests and
+    # tokens per minute.
+    def __init__(self, max_in_flight, requests_per_minute=0, tokens_per_minute=0):
+        self.limit = AdaptiveLimit(max_in_flight)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tokens):
+        async with self.limit.slot(), budget.slot():
+            if self.requests is not None:
+                await self.requests.acquire()
+            if self.tokens is not None:
+                await self.tokens.acquire(tokens)
+            yield
+
+    def record_output(self, tokens):
+        if self.tokens is not None:
+            self.tokens.consume(tokens)
+
+
+class LLMDispatcher:
+    # Shared client layer for every LLM call: per-provider rate limits and
+    # adaptive concurrency, with retries on throttling and transient errors.
+    # Providers classify their own errors (see LLMProvider.classify_error).
+    def __init__(self, max_in_flight=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.lanes = {}
+
+    def lane(self, provider):
+        lane = self.lanes.get(provider.name)
+        if lane is None:
+            lane = self.lanes[provider.name] = Lane(
+                self.max_in_flight, provider.requests_per_minute, provider.tokens_per_minute
+            )
+        return lane
+
+    def retry_delay(self, provider, lane, error, attempt):
+        # Returns how long to wait before retrying, or None to give up.
+        kind = provider.classify_error(error)
+        if kind is None or attempt >= self.max_retries:
+            return None
+        if kind == 'throttled':
+            lane.limit.decrease()
+        delay = provider.retry_after(error)
+        if delay is None:
+            # Full jitter keeps retries from many calls from arriving together.
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        logger.warning("%s call failed (%s: %s); retrying in %.1fs.", provider.label, kind, error, delay)
+        return delay
+
+    async def submit(self, provider, tokens, func, *args, **kwargs):
+        # tokens is the estimated input size, charged against tokens per minute.
+        lane = self.lane(provider)
+        for attempt in itertools.count():
+            async with lane.slot(tokens):
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    delay = self.retry_delay(provider, lane, e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    lane.limit.increase()
+                    lane.record_output(provider.count_tokens(result or ''))
+                    return result
+            await asyncio.sleep(delay)
+
+    async def stream(self, provider, tokens, func, *args, **kwargs):
+        # Only retried until the first chunk arrives; after that a failure is
+        # raised, since the caller has already seen part of the output.
+        lane = self.lane(provider)
+        for attempt in itertools.count():
+            received = []
+            async with lane.slot(tokens):
+                try:
+                    async for item in func(*args, **kwargs):
+                        received.append(item)
+                        yield item
+                except Exception as e:
+                    delay = None if received else self.retry_delay(provider, lane, e, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    lane.limit.increase()
+                    lane.record_output(provider.count_tokens(''.join(received)))
+                    return
+            await asyncio.sleep(delay)
+
+
+budget = ConcurrencyBudget(int(os.environ.get('QPAL_CONCURRENCY_BUDGET', 0)))
+dispatcher = LLMDispatcher()
@@ -0,0 +1,156 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+# Seconds, from a cache hit up to a slow LLM call.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Counter:
+    # Minimal Prometheus-style metrics, safe to update from the event loop and
+    # read from a web server thread.
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{format_labels(key)} {value}" for key, value in sorted(self.values.items())]
+
+    def render(self):
+        return '\n'.join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            buckets, count, total = self.values.get(key, ([0] * len(self.buckets), 0, 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[i] += 1
+            self.values[key] = (buckets, count + 1, total + value)
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (buckets, count, total) in sorted(self.values.items()):
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+stage_seconds = Histogram('qpal_stage_seconds', 'Time spent in each pipeline stage.')
+stage_errors = Counter('qpal_stage_errors_total', 'Pipeline stages that raised or were cancelled.')
+llm_tokens = Counter('qpal_llm_tokens_total', 'Approximate LLM tokens sent and received.')
+queries = Counter('qpal_queries_total', 'Queries run to completion.')
+coalesced_calls = Counter('qpal_coalesced_calls_total', 'Calls that joined an identical call already in flight.')
+startup_seconds = Gauge('qpal_startup_seconds', 'Seconds taken by each startup step.')
+summary_cache_lookups = Counter('qpal_summary_cache_total', 'Summary cache lookups by result (hit or miss).')
+
+METRICS = (stage_seconds, stage_errors, llm_tokens, queries, coalesced_calls, startup_seconds, summary_cache_lookups)
+
+
+def render():
+    return '\n'.join(metric.render() for metric in METRICS) + '\n'
+
+
+def process_uptime():
+    # Seconds since this process started, read from /proc; None elsewhere.
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 3)
+
+
+class Trace:
+    # Spans recorded for one query, with offsets relative to its start.
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, stage, start, duration, attributes):
+        self.spans.append({
+            'stage': stage,
+            'start': round(start - self.start, 4),
+            'duration': round(duration, 4),
+            **attributes
+        })
+
+    def totals(self):
+        totals = {}
+        for recorded in self.spans:
+            totals[recorded['stage']] = round(totals.get(recorded['stage'], 0) + recorded['duration'], 4)
+        return totals
+
+
+current_trace = contextvars.ContextVar('qpal_trace', default=None)
+
+
+def start_trace():
+    # Tasks created afterwards inherit the trace through their context.
+    trace = Trace()
+    current_trace.set(trace)
+    return trace
+
+
+@contextlib.contextmanager
+def span(stage, **attributes):
+    # Times a block as one pipeline stage. The yielded dict can be filled in
+    # with extra attributes (token counts, sizes); they go to the query trace
+    # only, so histogram label cardinality stays fixed.
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield attributes
+    except BaseException as e:
+        status = 'cancelled' if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else 'error'
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stage_seconds.observe(duration, stage=stage)
+        if status != 'ok':
+            stage_errors.inc(stage=stage, status=status)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, duration, {**attributes, 'status': status})
@@ -0,0 +1,253 @@
+import asyncio
+import codecs
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures.process import BrokenProcessPool
+
+import chardet
+import lxml.html
+
+logger = logging.getLogger(__name__)
+
+PARSE_EXECUTOR = os.environ.get('PARSE_EXECUTOR', 'process')
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS') or os.cpu_count() or 1)
+CHARSET_SNIFF_BYTES = int(os.environ.get('CHARSET_SNIFF_BYTES', 16 * 1024))
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+# Elements that never hold page content.
+BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'template', 'iframe', 'svg', 'form', 'nav', 'aside', 'footer')
+# class/id words that mark banners, menus and widgets around the content.
+BOILERPLATE_HINTS = re.compile(
+    r'(?:^|[\s_-])(?:cookies?|consent|banner|newsletter|subscribe|share|social|promo|advert|ads?|'
+    r'breadcrumbs?|sidebar|menu|navbar|popup|modal|related|comments?)(?:$|[\s_-])',
+    re.IGNORECASE
+)
+BLOCK_TAGS = (
+    'address', 'article', 'blockquote', 'body', 'dd', 'div', 'dl', 'dt', 'figcaption', 'figure',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'li', 'main', 'ol', 'p', 'pre', 'section',
+    'table', 'tbody', 'thead', 'tfoot', 'tr', 'ul'
+)
+# Short blocks of these kinds are kept: headings give the summary its structure
+# and table rows are data.
+STRUCTURAL_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'tr')
+# List items (ingredients, spec sheets, bullet facts) are kept whenever their
+# list as a whole reads as content rather than as a menu of links.
+LIST_ITEM_TAGS = ('li', 'dd', 'dt')
+CELL_TAGS = ('td', 'th')
+MIN_BLOCK_CHARS = 25
+MAX_LINK_DENSITY = 0.5
+# Lines shorter than this are too generic to treat as cross-page boilerplate.
+DEDUPE_MIN_CHARS = 20
+
+_executor = None
+
+
+def known_charset(charset):
+    if not charset:
+        return None
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+def detect_charset(content_bytes, declared_charset=None):
+    # Cheapest source first: the Content-Type header, then a <meta> tag or
+    # chardet over the first few KB, and only then chardet over the whole body.
+    charset = known_charset(declared_charset)
+    if charset:
+        return charset
+    head = content_bytes[:CHARSET_SNIFF_BYTES]
+    match = META_CHARSET.search(head)
+    charset = known_charset(match.group(1).decode('ascii', 'ignore')) if match else None
+    if charset:
+        return charset
+    detected = chardet.detect(head)
+    if detected['encoding'] and detected['confidence'] >= 0.8:
+        return detected['encoding']
+    return chardet.detect(content_bytes)['encoding'] or 'utf-8'
+
+
+def text_length(element):
+    return len(' '.join(element.text_content().split()))
+
+
+def link_density(element):
+    text_chars = text_length(element)
+    if not text_chars:
+        return 1.0
+    return sum(len(link.text_content().strip()) for link in element.iter('a')) / text_chars
+
+
+def holds_content(element, body_chars):
+    # Theme wrappers such as <div class="site-content has-sidebar"> match the
+    # class/id hints too; an element around the main content or most of the
+    # page's text is a container, not a widget.
+    if element.find('.//main') is not None or element.find('.//article') is not None:
+        return True
+    return text_length(element) * 2 > body_chars
+
+
+def drop_boilerplate(tree):
+    for element in list(tree.iter(*BOILERPLATE_TAGS)):
+        element.drop_tree()
+    body = tree.find('.//body')
+    body_chars = text_length(body if body is not None else tree)
+    for element in tree.xpath('//*[@hidden or @aria-hidden="true" or @class or @id]'):
+        if element.tag in ('html', 'body', 'main', 'article'):
+            continue
+        if element.get('hidden') is not None or element.get('aria-hidden') == 'true':
+            element.drop_tree()
+        elif (BOILERPLATE_HINTS.search(f"{element.get('class', '')} {element.get('id', '')}")
+              and not holds_content(element, body_chars)):
+            element.drop_tree()
+
+
+def own_text(element):
+    # Text of an element minus its nested blocks, which are scored on their own,
+    # plus how much of it sits inside links.
+    parts = [element.text or '']
+    link_chars = 0
+    for child in element:
+        if isinstance(child.tag, str) and child.tag not in BLOCK_TAGS:
+            text = child.text_content()
+            parts.append(f" {text} " if child.tag in CELL_TAGS else text)
+            link_chars += sum(len(link.text_content().strip()) for link in child.iter('a'))
+        else:
+            parts.append(' ')
+        parts.append(child.tail or '')
+    return ' '.join(''.join(parts).split()), link_chars
+
+
+def extract_blocks(root):
+    # Readability-style scoring: keep blocks that are mostly prose rather than
+    # links, and drop short fragments such as labels and buttons.
+    blocks = []
+    list_densities = {}
+    for element in root.iter(*BLOCK_TAGS):
+        text, link_chars = own_text(element)
+        if not text or link_chars / len(text) > MAX_LINK_DENSITY:
+            continue
+        if element.tag in LIST_ITEM_TAGS:
+            parent = element.getparent()
+            if parent is not None:
+                if parent not in list_densities:
+                    list_densities[parent] = link_density(parent)
+                if list_densities[parent] <= MAX_LINK_DENSITY:
+                    blocks.append(text)
+                    continue
+        if element.tag in STRUCTURAL_TAGS or len(text) >= MIN_BLOCK_CHARS or text[-1] in '.!?':
+            blocks.append(text)
+    return blocks
+
+
+def extract_plaintext(content_bytes, declared_charset=None):
+    # Runs in the parse pool, so it must stay a picklable top-level function.
+    # Returns the page text and the number of characters dropped as boilerplate.
+    html = content_bytes.decode(detect_charset(content_bytes, declared_charset), errors='replace')
+    tree = lxml.html.fromstring(html)
+
+    title = tree.findtext('.//title')
+    body = tree.find('.//body')
+    if body is None:
+        body = tree
+    original_chars = text_length(body)
+
+    drop_boilerplate(tree)
+    blocks = []
+    main_content = tree.find('.//main')
+    if main_content is not None:
+        blocks = extract_blocks(main_content)
+    if not blocks:
+        blocks = extract_blocks(body)
+    main_text = '\n\n'.join(blocks)
+
+    return f"Title: {title}\n\nMain Content:\n{main_text}", max(0, original_chars - len(main_text))
+
+
+class BoilerplateFilter:
+    # Per-query state: lines already seen on earlier pages, and how many
+    # characters extraction and deduplication removed across the query.
+    def __init__(self):
+        self.seen = set()
+        self.extracted_chars = 0
+        self.duplicate_chars = 0
+
+    @property
+    def removed_chars(self):
+        return self.extracted_chars + self.duplicate_chars
+
+    def record(self, removed_chars):
+        self.extracted_chars += removed_chars
+
+    def dedupe(self, text):
+        # Footers, disclaimers and sign-up blurbs repeat across pages of the
+        # same site; only their first occurrence is kept.
+        lines = []
+        for line in text.split('\n'):
+            key = ' '.join(line.lower().split())
+            if len(key) >= DEDUPE_MIN_CHARS:
+                if key in self.seen:
+                    self.duplicate_chars += len(line)
+                    continue
+                self.seen.add(key)
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if PARSE_EXECUTOR == 'process':
+            _executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix='qpal-parse')
+        logger.info("Started %s %s parse workers.", PARSE_WORKERS, PARSE_EXECUTOR)
+    return _executor
+
+
+def discard_executor(executor):
+    # Forget a pool that can no longer run anything; the next call builds a
+    # new one. Only the pool that failed is dropped, in case another page
+    # already replaced it.
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def parse_page(content_bytes, declared_charset=None):
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = get_executor()
+        try:
+            return await loop.run_in_executor(executor, extract_plaintext, content_bytes, declared_charset)
+        except BrokenProcessPool:
+            # A worker died (killed for memory, or crashed on a hostile page)
+            # and took the whole pool with it. The page is retried once on a
+            # fresh pool; if that breaks too, only this page fails.
+            discard_executor(executor)
+            if attempt:
+                raise
+            logger.warning("Parse pool broke; restarting it.")
+
+
+def warm_executor():
+    # Start every parse worker now rather than on the first pages.
+    executor = get_executor()
+    for _ in range(PARSE_WORKERS):
+        executor.submit(os.getpid)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
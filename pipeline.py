@@ -0,0 +1,667 @@
+import asyncio
+import logging
+import os
+import re
+import time
+
+import aiohttp
+
+from cache import hash_key, memoized_summary, memoized_summary_stream, page_cache
+from chunking import PACK_MAX_TOKENS, PAGE_MAX_TOKENS, chunk_budget, pack_texts, split_text
+from corpus import CORPUS_MIN_PAGES, CORPUS_MODE, corpus_index
+from dedupe import NearDuplicates, UrlFilter, url_key
+from http_session import get_session, read_body
+from jobqueue import JobFailed, current_run_id, get_job_queue, in_worker, remote_queue
+from llm_dispatcher import LLM_MAX_CONCURRENCY, budget, dispatcher
+from metrics import llm_tokens, queries, span, stage_seconds, start_trace
+from parsing import BoilerplateFilter, parse_page
+from relevance import QUERY_FOCUS, PassageFilter, query_prompt
+from search import SEARCH_NUM_RESULTS, get_search_backend, search_urls
+from singleflight import SingleFlight
+from workspace import Workspace
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCRAPE_MAX_CONCURRENCY = int(os.environ.get('SCRAPE_MAX_CONCURRENCY', 10))
+COMPILE_MODE = os.environ.get('COMPILE_MODE', 'tree')
+COMPILE_FAN_IN = max(2, int(os.environ.get('COMPILE_FAN_IN', 4)))
+# Quorum mode: search SCRAPE_QUORUM + SCRAPE_HEDGE URLs and stop scraping once
+# SCRAPE_QUORUM usable pages are in or SCRAPE_DEADLINE seconds have passed.
+SCRAPE_QUORUM = int(os.environ.get('SCRAPE_QUORUM', 0))
+SCRAPE_HEDGE = int(os.environ.get('SCRAPE_HEDGE', 2))
+SCRAPE_DEADLINE = float(os.environ.get('SCRAPE_DEADLINE', 0))
+MIN_PAGE_CHARS = int(os.environ.get('MIN_PAGE_CHARS', 200))
+# A Content-Type outside these means the body is not a page worth reading.
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain')
+
+# Identical fetches and summarize calls that overlap in time, from this or
+# concurrent queries, are run once.
+fetches = SingleFlight('fetch')
+summary_calls = SingleFlight('summarize')
+
+# Decorative symbols (bullets, arrows, emoji) cost tokens without adding meaning.
+NOISE_CHARACTERS = re.compile(r'[^\w\s.,;:!?\'"()\[\]%$&/@#+=*-]')
+
+
+class QueryFailed(Exception):
+    # A query that produced no answer; the message is shown to the user.
+    pass
+
+
+def emit(on_event, event, data):
+    # Progress events for streaming clients; on_event(event, data) must not block.
+    if on_event is not None:
+        on_event(event, data)
+
+
+async def iterate_urls(urls):
+    if hasattr(urls, '__aiter__'):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+
+def take_packable(page_queue, batch, can_pack, carried):
+    # Opportunistically add pages that are already waiting to this batch; never
+    # waits, so packing only happens when summarizers are the bottleneck. The
+    # first item that cannot join goes to carried, to be this worker's next
+    # item: put back on the queue it would land behind the end-of-input
+    # markers and never be summarized.
+    while True:
+        try:
+            item = page_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        if item is None or not can_pack(batch, item):
+            carried.append(item)
+            return
+        batch.append(item)
+
+
+async def run_pipeline(urls, scrape, summarize, summarize_workers=LLM_MAX_CONCURRENCY, can_pack=None,
+                       quorum=None, deadline=None):
+    # Producer/consumer pipeline: every URL is scraped as soon as it arrives and
+    # each page is handed to a summarizer worker the moment its scrape finishes,
+    # so a slow site only delays its own summary.
+    #   scrape(url, url_index) -> page, or None to drop the page
+    #   summarize([(url_index, page), ...]) -> summary text
+    #   can_pack(batch, (url_index, page)) -> whether the page may join the batch
+    # With a quorum, scraping stops once that many pages are in; with a deadline,
+    # once that many seconds have passed. Outstanding scrapes are cancelled.
+    # Returns the summaries ordered by the first url_index of each batch.
+    page_queue = asyncio.Queue()
+    scrape_semaphore = asyncio.Semaphore(SCRAPE_MAX_CONCURRENCY)
+    summaries = {}
+    scraped = 0
+    enough = asyncio.Event()
+
+    async def produce(url, url_index):
+        nonlocal scraped
+        try:
+            async with scrape_semaphore, budget.slot():
+                page = await scrape(url, url_index)
+        except Exception as e:
+            logger.error("Error scraping URL %s: %s", url_index, e)
+            return
+        if page:
+            scraped += 1
+            page_queue.put_nowait((url_index, page))
+            if quorum and scraped >= quorum:
+                enough.set()
+
+    async def consume():
+        carried = []
+        while True:
+            item = carried.pop() if carried else await page_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            if can_pack is not None and can_pack([], item):
+                take_packable(page_queue, batch, can_pack, carried)
+            try:
+                summaries[batch[0][0]] = await summarize(batch)
+            except Exception as e:
+                logger.error("Error summarizing URL %s: %s", batch[0][0], e)
+
+    producers = []
+
+    async def feed():
+        url_index = 0
+        async for url in iterate_urls(urls):
+            url_index += 1
+            producers.append(asyncio.create_task(produce(url, url_index)))
+        await asyncio.gather(*producers)
+
+    workers = [asyncio.create_task(consume()) for _ in range(summarize_workers)]
+    feeder = asyncio.create_task(feed())
+    quorum_reached = asyncio.create_task(enough.wait())
+    try:
+        await asyncio.wait([feeder, quorum_reached], timeout=deadline or None, return_when=asyncio.FIRST_COMPLETED)
+        if not feeder.done():
+            outstanding = sum(not task.done() for task in producers)
+            reason = f"{scraped} pages scraped" if enough.is_set() else f"deadline of {deadline}s passed"
+            logger.info("Scraping stopped early (%s); cancelling %s outstanding scrapes.", reason, outstanding)
+            feeder.cancel()
+            for task in producers:
+                task.cancel()
+            await asyncio.gather(feeder, *producers, return_exceptions=True)
+        else:
+            feeder.result()
+        for _ in workers:
+            await page_queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in [feeder, quorum_reached] + producers + workers:
+            task.cancel()
+
+    return [summaries[i] for i in sorted(summaries)]
+
+
+async def scrape_plaintext(url, boilerplate=None):
+    cached = page_cache.get(url) if page_cache is not None else None
+    if cached is not None and page_cache.is_fresh(cached):
+        logger.info("Page cache hit for %s.", url)
+        return cached['content']
+
+    session = get_session()
+    try:
+        headers = page_cache.conditional_headers(cached) if page_cache is not None else {}
+        with span('fetch', url=url) as attributes:
+            async with session.get(url, headers=headers) as response:
+                attributes['status'] = response.status
+                if response.status == 304 and cached is not None:
+                    page_cache.touch(url)
+                    logger.info("Page cache revalidated for %s.", url)
+                    return cached['content']
+                response.raise_for_status()
+                if 'Content-Type' in response.headers and response.content_type not in HTML_CONTENT_TYPES:
+                    logger.info("Skipping %s: %s is not HTML.", url, response.content_type)
+                    return None
+                content_bytes = await read_body(response)
+                attributes['bytes'] = len(content_bytes)
+        with span('parse', url=url) as attributes:
+            plaintext, removed_chars = await parse_page(content_bytes, response.charset)
+            attributes['removed_chars'] = removed_chars
+        logger.info("Extraction removed %s characters of boilerplate from %s.", removed_chars, url)
+        if boilerplate is not None:
+            boilerplate.record(removed_chars)
+        if page_cache is not None:
+            page_cache.put(url, plaintext, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return plaintext
+    except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError) as e:
+        # Failures return None rather than text, so they are never summarized.
+        logger.error("Error accessing URL: %s\nError message: %s", url, e)
+        return None
+
+
+async def fetch_plaintext(url, boilerplate=None):
+    # In distributed mode the download and parse happen on a worker.
+    queue = remote_queue()
+    if queue is None:
+        return await scrape_plaintext(url, boilerplate)
+    try:
+        page = await queue.call('fetch', {'url': url})
+    except (JobFailed, asyncio.TimeoutError) as e:
+        logger.error("Error accessing URL: %s\nError message: %s", url, e)
+        return None
+    if page is None:
+        return None
+    if boilerplate is not None:
+        boilerplate.record(page['removed_chars'])
+    return page['text']
+
+
+async def search_results(query, backend, num_results):
+    queue = remote_queue()
+    if queue is None:
+        async for url in search_urls(query, backend, num_results):
+            yield url
+        return
+    try:
+        urls = await queue.call('search', {'query': query, 'backend': backend.name, 'num_results': num_results})
+    except (JobFailed, asyncio.TimeoutError) as e:
+        logger.error("Error during %s search: %s", backend.name, e)
+        return
+    for url in urls:
+        yield url
+
+
+def clean_text(text):
+    # Sentence punctuation stays: it keeps the text readable for the model.
+    cleaned_text = NOISE_CHARACTERS.sub('', text)
+    cleaned_text = ' '.join(cleaned_text.split())
+    return cleaned_text
+
+
+async def fetch_page(url, boilerplate=None):
+    # The page's text as extracted, before any per-query filtering, added to
+    # the corpus index; None if it could not be fetched.
+    plaintext = await fetches.do(url_key(url), fetch_plaintext, url, boilerplate)
+    if plaintext is not None and corpus_index is not None:
+        corpus_index.put(url, plaintext)
+    return plaintext
+
+
+async def scrape_and_save(url, workspace, url_index, max_tokens, count_tokens, boilerplate=None, near_duplicates=None,
+                          passages=None, prefetched=None):
+    # Returns the page as a list of cleaned chunks of at most max_tokens each.
+    # prefetched is the page text when it is already known (from the corpus
+    # index or a batch's PageMemo); otherwise the page is fetched.
+    try:
+        if prefetched is not None:
+            plaintext = prefetched
+        else:
+            plaintext = await fetch_page(url, boilerplate)
+            if plaintext is None:
+                return None
+        if near_duplicates is not None:
+            # Compared before line deduplication, which would strip most of a
+            # copy's text and hide the resemblance.
+            original = near_duplicates.check(url, plaintext)
+            if original is not None:
+                logger.info("URL%s is a near-duplicate of %s; skipping it.", url_index, original)
+                return None
+        if boilerplate is not None:
+            plaintext = boilerplate.dedupe(plaintext)
+        if passages is not None:
+            plaintext = passages.select(plaintext, count_tokens)
+        chunks = []
+        page_tokens = 0
+        for chunk in split_text(plaintext, max_tokens, count_tokens):
+            cleaned_chunk = clean_text(chunk)
+            if not cleaned_chunk:
+                continue
+            page_tokens += count_tokens(cleaned_chunk)
+            if page_tokens > PAGE_MAX_TOKENS and chunks:
+                logger.info("URL%s exceeds %s tokens; the rest of the page is skipped.", url_index, PAGE_MAX_TOKENS)
+                break
+            chunks.append(cleaned_chunk)
+        if sum(len(chunk) for chunk in chunks) < MIN_PAGE_CHARS:
+            logger.info("URL%s has too little content to summarize; skipping it.", url_index)
+            return None
+        workspace.write(os.path.join('URLoutput', f'URL{url_index}output.txt'), '\n\n'.join(chunks))
+        logger.info("Data for URL%s has been scraped into %s chunks.", url_index, len(chunks))
+        return chunks
+    except Exception as e:
+        logger.error("Error scraping and saving URL %s: %s", url_index, e)
+        return None
+
+
+async def call_llm(provider, prompt, content):
+    with span('llm', provider=provider.name) as attributes:
+        summary = await provider.complete(prompt, content)
+        record_tokens(provider, attributes, prompt + content, summary)
+    return summary
+
+
+async def stream_llm(provider, prompt, content):
+    with span('llm', provider=provider.name, streamed=True) as attributes:
+        chunks = []
+        async for text in provider.stream(prompt, content):
+            chunks.append(text)
+            yield text
+        record_tokens(provider, attributes, prompt + content, ''.join(chunks))
+
+
+def record_tokens(provider, attributes, sent, received):
+    attributes['input_tokens'] = provider.count_tokens(sent)
+    attributes['output_tokens'] = provider.count_tokens(received)
+    llm_tokens.inc(attributes['input_tokens'], provider=provider.name, direction='input')
+    llm_tokens.inc(attributes['output_tokens'], provider=provider.name, direction='output')
+
+
+async def request_summary(provider, content, prompt):
+    queue = remote_queue()
+    if queue is not None:
+        # Sent to a worker, which applies the cache and rate limits itself.
+        return await queue.call('summarize', {'model': provider.name, 'content': content, 'prompt': prompt})
+    tokens = provider.count_tokens(prompt + content)
+    return await memoized_summary(
+        content, prompt, provider.model, provider.params,
+        lambda: dispatcher.submit(provider, tokens, call_llm, provider, prompt, content)
+    )
+
+
+async def summarize(provider, content, prompt):
+    # Returns "" if the call still fails after the dispatcher's retries.
+    try:
+        # A worker running in this process must not join the call that is
+        # waiting for it.
+        return await summary_calls.do(
+            (in_worker.get(), hash_key(provider.name, provider.model, provider.params, prompt, content)),
+            request_summary, provider, content, prompt
+        )
+    except Exception as e:
+        logger.error("Error during summarization: %s", e)
+        return ""
+
+
+async def stream_summary(provider, content, prompt):
+    tokens = provider.count_tokens(prompt + content)
+    try:
+        async for text in memoized_summary_stream(
+            content, prompt, provider.model, provider.params,
+            lambda: dispatcher.stream(provider, tokens, stream_llm, provider, prompt, content)
+        ):
+            yield text
+    except Exception as e:
+        # Not swallowed: whatever was streamed so far is not a complete answer.
+        logger.error("Error during streaming summarization: %s", e)
+        raise QueryFailed("The final summary could not be completed.") from e
+
+
+async def reduce_summaries(provider, summaries, prompt, max_tokens):
+    # Merge summaries in rounds of parallel calls, each call taking as many
+    # consecutive summaries as fit in max_tokens (at least two).
+    while len(summaries) > 1:
+        groups = pack_texts(summaries, max_tokens, provider.count_tokens)
+        if len(groups) == len(summaries):
+            groups = ['\n\n'.join(summaries[i:i + 2]) for i in range(0, len(summaries), 2)]
+        merged = await asyncio.gather(*(summarize(provider, group, prompt) for group in groups))
+        # A failed merge passes its inputs on unmerged rather than losing them.
+        summaries = [summary or group for summary, group in zip(merged, groups)]
+    return summaries[0] if summaries else ""
+
+
+async def summarize_chunks(provider, chunks, prompt, max_tokens):
+    # Map-reduce for pages longer than one chunk: summarize the chunks in
+    # parallel, then merge the partial summaries.
+    if len(chunks) == 1:
+        return await summarize(provider, chunks[0], prompt)
+    partials = await asyncio.gather(*(summarize(provider, chunk, prompt) for chunk in chunks))
+    return await reduce_summaries(provider, [partial for partial in partials if partial], provider.merge_prompt, max_tokens)
+
+
+async def summarize_and_save(provider, pages, workspace, prompt, max_tokens):
+    # pages is a list of (url_index, chunks); several small single-chunk pages
+    # may be packed into one call.
+    if len(pages) == 1:
+        summary = await summarize_chunks(provider, pages[0][1], prompt, max_tokens)
+    else:
+        content = '\n\n'.join(f"Webpage {url_index}:\n{chunks[0]}" for url_index, chunks in pages)
+        summary = await summarize(provider, content, prompt)
+    summary_file = os.path.join('URLsummaries', f'URL{pages[0][0]}Summary.txt')
+    workspace.write(summary_file, summary)
+    logger.info("Summary %s is complete.", summary_file)
+    return summary
+
+
+class TreeReducer:
+    # Streaming k-way reduce for the compile step. Summaries are added as they
+    # finish; whenever fan_in of them are waiting at one level they are merged
+    # by a single call whose result moves up a level, so early merges overlap
+    # with the pages that are still being summarized.
+    def __init__(self, merge, fan_in=COMPILE_FAN_IN):
+        self.merge = merge
+        self.fan_in = fan_in
+        self.levels = []
+        self.tasks = set()
+
+    def add(self, summary, level=0):
+        if not summary:
+            return
+        while len(self.levels) <= level:
+            self.levels.append([])
+        pending = self.levels[level]
+        pending.append(summary)
+        if len(pending) >= self.fan_in:
+            group = pending[:self.fan_in]
+            del pending[:self.fan_in]
+            task = asyncio.create_task(self.merge_group(group, level))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def merge_group(self, group, level):
+        # A failed merge moves its inputs up concatenated, so they are merged
+        # again at the next level rather than lost.
+        self.add(await self.merge(group) or '\n'.join(group), level + 1)
+
+    async def finish(self):
+        # Returns at most fan_in summaries for the final top-level call.
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks))
+        remaining = [summary for pending in reversed(self.levels) for summary in pending]
+        self.levels = []
+        while len(remaining) > self.fan_in:
+            groups = [remaining[i:i + self.fan_in] for i in range(0, len(remaining), self.fan_in)]
+            merged = await asyncio.gather(*(self.merge(group) for group in groups))
+            remaining = [summary or '\n'.join(group) for summary, group in zip(merged, groups)]
+        return remaining
+
+    def cancel(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+
+class PageMemo:
+    # Shares pages between the queries of a batch, keyed by canonical URL, so
+    # each page is fetched and summarized once. Concurrent requests for the
+    # same page wait for the first; the shared work is shielded from any one
+    # query being cancelled. Pages are kept as fetched: near-duplicate, line
+    # and relevance filtering depend on the query and run after the lookup.
+    # Page text is dropped once its summary exists. Query-focused pages and
+    # summaries are only shared within their scope (the query).
+    SUMMARIZED = ['']
+
+    def __init__(self):
+        self.pages = {}
+        self.summaries = {}
+
+    async def shared(self, futures, key, compute):
+        future = futures.get(key)
+        if future is None:
+            future = futures[key] = asyncio.ensure_future(compute())
+        return await asyncio.shield(future)
+
+    async def scrape(self, url, scrape, scope=''):
+        key = (scope, url_key(url))
+        if key in self.summaries:
+            return self.SUMMARIZED
+        return await self.shared(self.pages, key, scrape)
+
+    async def summarize(self, url, summarize, scope=''):
+        key = (scope, url_key(url))
+        summary = await self.shared(self.summaries, key, summarize)
+        self.pages.pop(key, None)
+        return summary
+
+
+def compile_summaries(summaries, workspace):
+    # Pages whose summary failed are left out rather than compiled in as blanks.
+    compiled_summary = "\n".join(summary for summary in summaries if summary)
+    workspace.write(os.path.join('URLsummaries', 'URLsummaries.txt'), compiled_summary)
+    logger.info("All %s summaries have been compiled.", len(summaries))
+    return compiled_summary
+
+
+async def main(search_query, provider, on_event=None, run_id=None, trace=False, page_memo=None):
+    # With trace=True the query's spans are sent as a 'trace' event at the end.
+    # A PageMemo shares pages with the other queries of a batch; pages are then
+    # summarized one per call so their summaries can be reused.
+    start_time = time.time()
+    logger.info("Starting the main function...")
+    query_trace = start_trace()
+    workspace = Workspace(run_id)
+    emit(on_event, 'run', {'run_id': workspace.run_id})
+    # Jobs enqueued for this query carry its run ID.
+    current_run_id.set(workspace.run_id)
+
+    backend = get_search_backend()
+    num_results = SCRAPE_QUORUM + SCRAPE_HEDGE if SCRAPE_QUORUM else SEARCH_NUM_RESULTS
+    logger.info("Searching with %s...", backend.name)
+    urls = []
+    url_filter = UrlFilter()
+    # Pages (and summaries written for this query) answered from the corpus index.
+    local_pages = {}
+    local_summaries = {}
+
+    def search_local():
+        for document in corpus_index.search(search_query, num_results):
+            url, _ = url_filter.admit(document['url'])
+            if url is None:
+                continue
+            local_pages[url] = document['content']
+            if document['summary'] and document['summary_scope'] == memo_scope:
+                local_summaries[url] = document['summary']
+            yield url
+
+    async def search_links():
+        # URLs are canonicalized and handed to the scrapers as the search
+        # produces them; repeats and unscrapable links are never fetched.
+        with span('search', backend=backend.name) as attributes:
+            if CORPUS_MODE == 'cache_first' and corpus_index is not None:
+                for url in search_local():
+                    urls.append(url)
+                    yield url
+                attributes['local'] = len(local_pages)
+                logger.info("%s indexed pages match the query.", len(urls))
+            if len(urls) < (CORPUS_MIN_PAGES if local_pages and CORPUS_MIN_PAGES else num_results):
+                async for url in search_results(search_query, backend, num_results):
+                    admitted, reason = url_filter.admit(url)
+                    if admitted is None:
+                        logger.debug("Dropping %s: %s.", url, reason)
+                        continue
+                    url = admitted
+                    urls.append(url)
+                    yield url
+                    if local_pages and len(urls) >= num_results:
+                        break
+            attributes['results'] = len(urls)
+        logger.info(
+            "Search returned %s links (%s duplicates and %s unscrapable links dropped).",
+            len(urls), url_filter.duplicates, url_filter.skipped
+        )
+        workspace.write('URLS.txt', '\n'.join(urls))
+        emit(on_event, 'links', {'urls': urls})
+
+    logger.info("Scraping and summarizing webpages using %s (%s)...", provider.label, provider.model)
+
+    max_tokens = chunk_budget(provider)
+    boilerplate = BoilerplateFilter()
+    near_duplicates = NearDuplicates()
+    if QUERY_FOCUS:
+        passages = PassageFilter(search_query)
+        page_prompt = query_prompt(provider.page_prompt, search_query)
+        memo_scope = ' '.join(search_query.lower().split())
+    else:
+        passages = None
+        page_prompt = provider.page_prompt
+        memo_scope = ''
+
+    page_urls = {}
+
+    async def scrape_page(url, url_index):
+        page_urls[url_index] = url
+
+        plaintext = local_pages.get(url)
+        if plaintext is None and page_memo is not None:
+            plaintext = await page_memo.scrape(url, lambda: fetch_page(url, boilerplate), memo_scope)
+            if plaintext is None:
+                return None
+        if plaintext is PageMemo.SUMMARIZED:
+            chunks = plaintext
+        else:
+            chunks = await scrape_and_save(
+                url, workspace, url_index, max_tokens, provider.count_tokens, boilerplate, near_duplicates, passages,
+                plaintext
+            )
+        if chunks:
+            emit(on_event, 'scraped', {'index': url_index, 'url': url})
+        return chunks
+
+    reducer = None
+    if COMPILE_MODE == 'tree':
+        async def merge(group):
+            return await summarize(provider, "\n".join(group), provider.compile_prompt)
+        reducer = TreeReducer(merge)
+
+    async def summarize_pages(pages):
+        def summarize():
+            return summarize_and_save(provider, pages, workspace, page_prompt, max_tokens)
+
+        url = page_urls[pages[0][0]]
+        if url in local_summaries:
+            summary = local_summaries[url]
+        elif page_memo is not None:
+            summary = await page_memo.summarize(url, summarize, memo_scope)
+        else:
+            summary = await summarize()
+        if summary and len(pages) == 1 and corpus_index is not None and url not in local_summaries:
+            corpus_index.set_summary(url, summary, memo_scope)
+        indexes = [url_index for url_index, _ in pages]
+        if not summary:
+            logger.warning("No summary for URL %s; leaving it out of the compilation.", ', '.join(map(str, indexes)))
+        emit(on_event, 'summary', {'index': indexes[0], 'indexes': indexes, 'summary': summary})
+        if reducer is not None:
+            reducer.add(summary)
+        return summary
+
+    def can_pack(batch, page):
+        # Pages with a summary from the corpus index are never sent again.
+        if any(page_urls[url_index] in local_summaries for url_index, _ in batch + [page]):
+            return False
+        chunks = page[1]
+        if len(chunks) != 1 or provider.count_tokens(chunks[0]) > PACK_MAX_TOKENS:
+            return False
+        batch_tokens = sum(provider.count_tokens(batch_chunks[0]) for _, batch_chunks in batch)
+        return batch_tokens + provider.count_tokens(chunks[0]) <= max_tokens
+
+    try:
+        summaries = await run_pipeline(
+            search_links(), scrape_page, summarize_pages, can_pack=can_pack if page_memo is None else None,
+            quorum=SCRAPE_QUORUM, deadline=SCRAPE_DEADLINE
+        )
+        if reducer is not None:
+            logger.info("Finishing the tree merge of %s summaries...", len(summaries))
+            with span('compile', summaries=len(summaries)):
+                summaries = await reducer.finish()
+    finally:
+        if reducer is not None:
+            reducer.cancel()
+
+    logger.info(
+        "Boilerplate removal dropped %s characters (%s during extraction, %s repeated across pages).",
+        boilerplate.removed_chars, boilerplate.extracted_chars, boilerplate.duplicate_chars
+    )
+    if near_duplicates.dropped:
+        logger.info("Skipped %s near-duplicate pages.", near_duplicates.dropped)
+    if passages is not None and passages.dropped_tokens:
+        logger.info(
+            "Relevance prefilter kept %s tokens and dropped %s less relevant ones.",
+            passages.kept_tokens, passages.dropped_tokens
+        )
+    logger.info("Compiling individual summaries...")
+    compiled_summary = compile_summaries(summaries, workspace)
+    if not compiled_summary.strip():
+        # Nothing was scraped or every summary failed: the final call would
+        # be paid for with only the prompt in it.
+        logger.warning("No usable pages for %r; skipping the final summary.", search_query)
+        raise QueryFailed("No usable pages were found for this query.")
+
+    logger.info("Summarizing the compiled summaries using %s (%s)...", provider.label, provider.model)
+    final_summary_chunks = []
+    with span('final', provider=provider.name):
+        async for text in stream_summary(provider, compiled_summary, provider.final_prompt):
+            final_summary_chunks.append(text)
+            emit(on_event, 'token', {'text': text})
+    final_summary = ''.join(final_summary_chunks)
+    workspace.write('Finalsummary.txt', final_summary)
+    logger.info("Final summary is complete.")
+    job_queue = get_job_queue()
+    if job_queue is not None:
+        # Results are not needed once the query is done, except by other
+        # queries that joined one of its calls; those, and jobs left behind
+        # by failed queries, expire on their own.
+        job_queue.purge(workspace.run_id, keep=job_queue.waiting())
+
+    end_time = time.time()
+    stage_seconds.observe(end_time - start_time, stage='query')
+    queries.inc(provider=provider.name)
+    logger.info("Main function completed in %.2f seconds.", end_time - start_time)
+    logger.info("Time per stage (summed over spans): %s", query_trace.totals())
+    if trace:
+        emit(on_event, 'trace', {'spans': query_trace.spans, 'totals': query_trace.totals()})
+    return final_summary
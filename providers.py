@@ -0,0 +1,246 @@
+import asyncio
+import functools
+import json
+import os
+
+from llm_dispatcher import LoopLocal, iterate_blocking, parse_retry_after
+
+APPROX_CHARS_PER_TOKEN = 4
+# Upper bound in seconds on a single LLM call, so a stalled request cannot hold up a query forever.
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 120))
+
+# 529 is Anthropic's "overloaded" status.
+THROTTLE_STATUSES = (429, 529)
+RETRY_STATUSES = (408, 500, 502, 503, 504)
+BEDROCK_THROTTLE_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceQuotaExceededException')
+BEDROCK_RETRY_CODES = ('ServiceUnavailableException', 'ModelNotReadyException', 'ModelTimeoutException', 'InternalServerException')
+
+CLAUDE_FINAL_PROMPT = """Here is a compilation of summaries that were generated from various webpages. Provide ALL of the details from the information. There will be varyibg topics. Be very thorough but make sure to remove all duplicate information.
+                          """
+
+
+class LLMProvider:
+    # A provider adapts one LLM API to the pipeline. Subclasses set name/label,
+    # model and params (the sampling parameters, also used as part of the
+    # summary cache key) and implement complete() and stream().
+    name = None
+    label = None
+    # Errors worth retrying besides the HTTP statuses below (connection resets, timeouts).
+    transient_errors = (asyncio.TimeoutError, ConnectionError)
+    page_prompt = "Summarize the information. Be thorough:"
+    compile_prompt = "Here are summaries generated from several webpages. Merge them into one summary that keeps ALL of the details but removes duplicate information:"
+    merge_prompt = "These are summaries of consecutive parts of the same webpage. Combine them into one thorough summary without dropping any details:"
+    final_prompt = CLAUDE_FINAL_PROMPT
+
+    def __init__(self, model, params, context_tokens, requests_per_minute=0, tokens_per_minute=0):
+        self.model = model
+        self.params = params
+        self.context_tokens = context_tokens
+        # Quotas enforced by the dispatcher; 0 means unlimited.
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    async def complete(self, prompt, content):
+        raise NotImplementedError
+
+    async def stream(self, prompt, content):
+        # Providers without a streaming API yield the whole completion at once.
+        yield await self.complete(prompt, content)
+
+    def count_tokens(self, text):
+        return len(text) // APPROX_CHARS_PER_TOKEN + 1
+
+    async def warm(self):
+        # Build the SDK client ahead of the first call.
+        pass
+
+    def classify_error(self, error):
+        # 'throttled' for rate limits and overload, 'retryable' for other
+        # transient failures, None for errors a retry will not fix.
+        status = getattr(error, 'status_code', None)
+        if status in THROTTLE_STATUSES:
+            return 'throttled'
+        if status in RETRY_STATUSES or isinstance(error, self.transient_errors):
+            return 'retryable'
+        return None
+
+    def retry_after(self, error):
+        response = getattr(error, 'response', None)
+        return parse_retry_after(getattr(response, 'headers', None))
+
+
+class AnthropicProvider(LLMProvider):
+    name = 'anthropic'
+    label = 'Anthropic'
+
+    def __init__(self):
+        super().__init__(os.environ.get('ANTHROPIC_MODEL'), {
+            'max_tokens': 4096,
+            'temperature': 0.7,
+            'top_p': 0.9,
+            'top_k': 50,
+            'stop_sequences': ["Human:", "Claude:"],
+        }, int(os.environ.get('ANTHROPIC_CONTEXT_TOKENS', 200000)),
+            int(os.environ.get('ANTHROPIC_RPM', 0)), int(os.environ.get('ANTHROPIC_TPM', 0)))
+        import anthropic
+        api_key = os.environ.get('ANTHROPIC_API_KEY')
+        self.transient_errors = LLMProvider.transient_errors + (anthropic.APIConnectionError,)
+        # Retries are left to the dispatcher, which also adapts concurrency.
+        self.client = LoopLocal(lambda: anthropic.AsyncAnthropic(api_key=api_key, timeout=LLM_TIMEOUT, max_retries=0))
+
+    async def warm(self):
+        self.client.get()
+
+    def request(self, prompt, content):
+        return {
+            'messages': [
+                {"role": "user", "content": prompt + content}
+            ],
+            'model': self.model,
+            **self.params
+        }
+
+    async def complete(self, prompt, content):
+        message = await self.client.get().messages.create(**self.request(prompt, content))
+        return ''.join(block.text for block in message.content)
+
+    async def stream(self, prompt, content):
+        async with self.client.get().messages.stream(**self.request(prompt, content)) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+
+class OpenAIProvider(LLMProvider):
+    name = 'openai'
+    label = 'OpenAI'
+    page_prompt = "Summarize the information from the webpage in this document:"
+    final_prompt = """I would like to receive all of the information and content from the following compilation of summaries, also summarized in a condensed format. Do not leave any info out, but ignore errors and do not include them in the summary. List each topic in list format with details next to it."""
+
+    def __init__(self):
+        super().__init__(os.environ.get('OPENAI_MODEL'), {
+            'max_tokens': 4096,
+            'temperature': 0.7,
+            'top_p': 0.9,
+        }, int(os.environ.get('OPENAI_CONTEXT_TOKENS', 16000)),
+            int(os.environ.get('OPENAI_RPM', 0)), int(os.environ.get('OPENAI_TPM', 0)))
+        import openai
+        api_key = os.environ.get('OPENAI_API_KEY')
+        # Point OPENAI_BASE_URL at any OpenAI-compatible server (e.g. a local one).
+        base_url = os.environ.get('OPENAI_BASE_URL') or None
+        self.transient_errors = LLMProvider.transient_errors + (openai.APIConnectionError,)
+        self.client = LoopLocal(lambda: openai.AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=LLM_TIMEOUT, max_retries=0))
+
+    async def warm(self):
+        self.client.get()
+
+    def request(self, prompt, content):
+        return {
+            'model': self.model,
+            'messages': [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": prompt + content}
+            ],
+            **self.params
+        }
+
+    async def complete(self, prompt, content):
+        response = await self.client.get().chat.completions.create(**self.request(prompt, content))
+        return response.choices[0].message.content
+
+    async def stream(self, prompt, content):
+        stream = await self.client.get().chat.completions.create(stream=True, **self.request(prompt, content))
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class BedrockProvider(LLMProvider):
+    name = 'bedrock'
+    label = 'Bedrock'
+
+    def __init__(self):
+        super().__init__(os.environ.get('AWS_MODEL'), {
+            "max_tokens": 4096,
+        }, int(os.environ.get('AWS_CONTEXT_TOKENS', 200000)),
+            int(os.environ.get('AWS_RPM', 0)), int(os.environ.get('AWS_TPM', 0)))
+        self.region = os.environ.get('AWS_REGION')
+        self.access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+        self.secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+        from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, ReadTimeoutError
+        self.client_error = ClientError
+        self.transient_errors = LLMProvider.transient_errors + (BotocoreConnectionError, ReadTimeoutError)
+
+    # boto3 clients are thread-safe, so one client is shared by every executor thread.
+    @functools.cached_property
+    def client(self):
+        import boto3
+        from botocore.config import Config
+        return boto3.client(
+            'bedrock-runtime',
+            region_name=self.region,
+            aws_access_key_id=self.access_key_id,
+            aws_secret_access_key=self.secret_access_key,
+            config=Config(read_timeout=LLM_TIMEOUT, retries={'total_max_attempts': 1})
+        )
+
+    def body(self, prompt, content):
+        return json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"{prompt}\n\n{content}"
+                }
+            ],
+            **self.params
+        })
+
+    def invoke(self, prompt, content):
+        response = self.client.invoke_model(body=self.body(prompt, content), modelId=self.model)
+        response_body = json.loads(response.get('body').read())
+        return response_body['content'][0]['text'].strip()
+
+    def invoke_stream(self, prompt, content):
+        response = self.client.invoke_model_with_response_stream(body=self.body(prompt, content), modelId=self.model)
+        for event in response.get('body'):
+            chunk = json.loads(event['chunk']['bytes'])
+            if chunk.get('type') == 'content_block_delta':
+                yield chunk['delta'].get('text', '')
+
+    async def warm(self):
+        # Creating a boto3 client blocks for a noticeable time.
+        await asyncio.get_running_loop().run_in_executor(None, lambda: self.client)
+
+    def classify_error(self, error):
+        if isinstance(error, self.client_error):
+            code = error.response.get('Error', {}).get('Code')
+            if code in BEDROCK_THROTTLE_CODES:
+                return 'throttled'
+            if code in BEDROCK_RETRY_CODES:
+                return 'retryable'
+            return None
+        return super().classify_error(error)
+
+    def retry_after(self, error):
+        if isinstance(error, self.client_error):
+            return parse_retry_after(error.response.get('ResponseMetadata', {}).get('HTTPHeaders'))
+        return None
+
+    async def complete(self, prompt, content):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.invoke, prompt, content)
+
+    async def stream(self, prompt, content):
+        async for text in iterate_blocking(self.invoke_stream, prompt, content):
+            yield text
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in (BedrockProvider, AnthropicProvider, OpenAIProvider)
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_provider(name):
+    return PROVIDERS[name]()
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import sys
+
+import settings  # noqa: F401 (loads .env; must come first)
+
+from backends import BACKENDS, DEFAULT_MODEL, warm_backends
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='qpal', description='Query, search, scrape and summarize from the command line.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch = commands.add_parser('batch', help='run every query in a JSONL file')
+    batch.add_argument('input', help='JSONL file of {"query": ..., "id": ..., "model": ...} objects')
+    batch.add_argument('-o', '--output', required=True, help='JSONL results file; also the checkpoint to resume from')
+    batch.add_argument('--model', default=DEFAULT_MODEL, choices=BACKENDS, help='model for queries that do not name one')
+    batch.add_argument('--concurrency', type=int, help='queries run at once (default BATCH_CONCURRENCY)')
+    batch.add_argument('--budget', type=int, default=0,
+                       help='page fetches and LLM calls in flight across all queries (default QPAL_CONCURRENCY_BUDGET)')
+
+    worker = commands.add_parser('worker', help='run search, fetch and summarize jobs from the job queue (QPAL_QUEUE)')
+    worker.add_argument('--kinds', default='search,fetch,summarize',
+                        help='comma-separated job kinds to take (default: all)')
+    worker.add_argument('--concurrency', type=int, help='jobs run at once (default WORKER_CONCURRENCY)')
+    worker.add_argument('--name', help='worker name recorded on claimed jobs (default host:pid)')
+    return parser.parse_args(argv)
+
+
+async def batch(args):
+    from batch import BATCH_CONCURRENCY, run_batch
+    from http_session import close_session
+    from parsing import shutdown_executor
+
+    try:
+        await warm_backends((args.model,))
+        return await run_batch(args.input, args.output, args.model, args.concurrency or BATCH_CONCURRENCY, args.budget)
+    finally:
+        await close_session()
+        shutdown_executor()
+
+
+async def worker(args):
+    from http_session import close_session
+    from parsing import shutdown_executor
+    from worker import WORKER_CONCURRENCY, WORKER_KINDS, run_worker
+
+    kinds = tuple(kind.strip() for kind in args.kinds.split(',') if kind.strip())
+    unknown = set(kinds) - set(WORKER_KINDS)
+    if unknown:
+        raise SystemExit(f"qpal worker: unknown job kinds: {', '.join(sorted(unknown))}")
+    try:
+        # Summarize jobs name their model; the default one is warmed up front.
+        await warm_backends((DEFAULT_MODEL,) if 'summarize' in kinds else ())
+        await run_worker(kinds, args.concurrency or WORKER_CONCURRENCY, args.name)
+    finally:
+        await close_session()
+        shutdown_executor()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'batch':
+        asyncio.run(batch(args))
+    elif args.command == 'worker':
+        asyncio.run(worker(args))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
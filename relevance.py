@@ -0,0 +1,104 @@
+import os
+import re
+
+from chunking import iter_pieces
+
+# Pages are cut down to their passages most relevant to the query, up to
+# PREFILTER_MAX_TOKENS each, before they are summarized; 0 sends whole pages.
+QUERY_FOCUS = os.environ.get('QUERY_FOCUS', '1') == '1'
+PREFILTER_MAX_TOKENS = int(os.environ.get('PREFILTER_MAX_TOKENS', 3000))
+PASSAGE_MAX_TOKENS = int(os.environ.get('PASSAGE_MAX_TOKENS', 200))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD = re.compile(r'\w+')
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'best', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'in', 'is', 'it', 'of', 'on', 'or', 'should', 'that', 'the', 'this', 'to', 'vs', 'was', 'what', 'when',
+    'where', 'which', 'who', 'why', 'with'
+))
+
+
+def query_terms(query):
+    terms = []
+    for word in WORD.findall(query.lower()):
+        if word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def query_prompt(prompt, query):
+    # Tells the model what the reader is after, so the summary keeps what
+    # bears on it.
+    return f"Search query: {query}\nFocus on information relevant to this query.\n\n{prompt}"
+
+
+class PassageFilter:
+    # Per-query BM25 over passages. Document frequencies and lengths accumulate
+    # over every passage of every page seen so far in the query, so a term
+    # found on every page counts for little; pages are scored as they arrive
+    # rather than after the last one.
+    def __init__(self, query, max_tokens=PREFILTER_MAX_TOKENS):
+        # NumPy is imported on first use, keeping it out of startup.
+        import numpy as np
+        self.terms = query_terms(query)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.max_tokens = max_tokens
+        self.document_frequency = np.zeros(len(self.terms))
+        self.passages = 0
+        self.total_length = 0
+        self.kept_tokens = 0
+        self.dropped_tokens = 0
+
+    def scores(self, passages):
+        import numpy as np
+        lengths = np.empty(len(passages))
+        owners = []
+        term_ids = []
+        for i, passage in enumerate(passages):
+            words = WORD.findall(passage.lower())
+            lengths[i] = len(words)
+            for word in words:
+                term_id = self.term_ids.get(word)
+                if term_id is not None:
+                    owners.append(i)
+                    term_ids.append(term_id)
+        width = len(self.terms)
+        flat = np.asarray(owners, dtype=np.int64) * width + np.asarray(term_ids, dtype=np.int64)
+        frequency = np.bincount(flat, minlength=len(passages) * width).reshape(len(passages), width)
+
+        self.document_frequency += (frequency > 0).sum(axis=0)
+        self.passages += len(passages)
+        self.total_length += lengths.sum()
+        idf = np.log1p((self.passages - self.document_frequency + 0.5) / (self.document_frequency + 0.5))
+        average_length = max(self.total_length / self.passages, 1.0)
+        norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * lengths[:, None] / average_length)
+        return (idf * frequency * (BM25_K1 + 1) / norm).sum(axis=1)
+
+    def select(self, text, count_tokens):
+        # Keeps the title and the highest-scoring passages that fit the budget,
+        # in page order. Pages already within the budget are left whole.
+        if not self.max_tokens or not self.terms:
+            return text
+        import numpy as np
+        passages = list(iter_pieces(text, PASSAGE_MAX_TOKENS, count_tokens))
+        if not passages:
+            return text
+        scores = self.scores(passages)
+        tokens = [count_tokens(passage) for passage in passages]
+        total = sum(tokens)
+        if total <= self.max_tokens:
+            self.kept_tokens += total
+            return text
+        # Ties (including pages with no query terms at all) go to earlier passages.
+        order = [0] + [i for i in np.argsort(-scores, kind='stable').tolist() if i != 0]
+        keep = []
+        budget = self.max_tokens
+        for i in order:
+            if tokens[i] <= budget:
+                keep.append(i)
+                budget -= tokens[i]
+        kept = self.max_tokens - budget
+        self.kept_tokens += kept
+        self.dropped_tokens += total - kept
+        return '\n\n'.join(passages[i] for i in sorted(keep))
@@ -0,0 +1,94 @@
+import functools
+import logging
+import os
+
+from cache import search_cache
+from http_session import get_session
+from llm_dispatcher import iterate_blocking
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'google')
+SEARCH_NUM_RESULTS = int(os.environ.get('SEARCH_NUM_RESULTS', 10))
+
+
+class SearchBackend:
+    # A search backend turns a query into result URLs. Subclasses set name and
+    # implement results() as an async generator so URLs reach the scraper as
+    # soon as the backend produces them.
+    name = None
+
+    def results(self, query, num_results):
+        raise NotImplementedError
+
+
+class GoogleSearchBackend(SearchBackend):
+    name = 'google'
+
+    async def results(self, query, num_results):
+        # Imported here so other backends never load it. googlesearch is a
+        # blocking generator; drive it on an executor thread.
+        from googlesearch import search as google_search
+        async for url in iterate_blocking(google_search, query, num_results=num_results):
+            yield url
+
+
+class SearxngSearchBackend(SearchBackend):
+    # A self-hosted SearXNG instance with the JSON output format enabled.
+    name = 'searxng'
+
+    def __init__(self):
+        self.url = (os.environ.get('SEARXNG_URL') or 'http://127.0.0.1:8888').rstrip('/')
+
+    async def results(self, query, num_results):
+        count = 0
+        page = 1
+        while count < num_results:
+            params = {'q': query, 'format': 'json', 'pageno': page}
+            async with get_session().get(f"{self.url}/search", params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+            results = data.get('results', [])
+            if not results:
+                return
+            for result in results:
+                if count >= num_results:
+                    return
+                count += 1
+                yield result['url']
+            page += 1
+
+
+SEARCH_BACKENDS = {
+    backend.name: backend
+    for backend in (GoogleSearchBackend, SearxngSearchBackend)
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_search_backend(name=SEARCH_BACKEND):
+    return SEARCH_BACKENDS[name]()
+
+
+async def search_urls(query, backend=None, num_results=SEARCH_NUM_RESULTS):
+    # Yields result URLs as they arrive. Repeated queries are answered from the
+    # search cache without contacting the backend.
+    backend = backend or get_search_backend()
+    if search_cache is not None:
+        urls = search_cache.get(backend.name, query, num_results)
+        if urls is not None:
+            logger.info("Search cache hit for %r.", query)
+            for url in urls:
+                yield url
+            return
+
+    urls = []
+    try:
+        async for url in backend.results(query, num_results):
+            urls.append(url)
+            yield url
+    except Exception as e:
+        logger.error("Error during %s search: %s", backend.name, e)
+        return
+    if urls and search_cache is not None:
+        search_cache.put(backend.name, query, num_results, urls)
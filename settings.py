@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Settings are read from the environment when modules are imported, so every
+# entry point imports this module before any other to load .env first.
+load_dotenv()
@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+from llm_dispatcher import LoopLocal
+from metrics import coalesced_calls
+
+SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', '1') == '1'
+
+
+class Flight:
+    # One in-flight call and everyone waiting on it. Progress events are kept
+    # so callers that join late see the ones they missed.
+    def __init__(self):
+        self.future = None
+        self.waiters = 0
+        self.events = []
+        self.listeners = []
+
+    def emit(self, event, data):
+        self.events.append((event, data))
+        for on_event in list(self.listeners):
+            on_event(event, data)
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution and its result
+    # (or exception). Nothing is kept once it finishes; caching is separate.
+    # The shared call is cancelled only when every caller has gone away.
+    # With events=True, func gets an on_event argument whose events reach
+    # every caller's on_event.
+    def __init__(self, name, events=False):
+        self.name = name
+        self.events = events
+        self._flights = LoopLocal(dict)
+
+    async def do(self, key, func, *args, on_event=None):
+        if not SINGLE_FLIGHT_ENABLED:
+            if self.events:
+                return await func(*args, on_event=on_event)
+            return await func(*args)
+        flights = self._flights.get()
+        flight = flights.get(key)
+        if flight is None:
+            flight = flights[key] = Flight()
+            flight.future = asyncio.ensure_future(func(*args, on_event=flight.emit) if self.events else func(*args))
+            flight.future.add_done_callback(lambda _: flights.pop(key, None) if flights.get(key) is flight else None)
+        else:
+            coalesced_calls.inc(kind=self.name)
+            if on_event is not None:
+                for event, data in flight.events:
+                    on_event(event, data)
+        if on_event is not None:
+            flight.listeners.append(on_event)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        finally:
+            flight.waiters -= 1
+            if on_event is not None:
+                flight.listeners.remove(on_event)
+            if not flight.waiters and not flight.future.done():
+                flight.future.cancel()
+                # Later callers start afresh rather than join a cancelled call.
+                if flights.get(key) is flight:
+                    del flights[key]
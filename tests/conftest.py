@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# Settings are read when modules are imported, so the test environment is set
+# up before any of them: caches and the corpus index live in a throwaway
+# directory and parsing stays in-process.
+os.environ.update(
+    CACHE_DIR=tempfile.mkdtemp(prefix='qpal-test-'),
+    PAGE_CACHE_ENABLED='0',
+    SUMMARY_CACHE_ENABLED='0',
+    SEARCH_CACHE_ENABLED='0',
+    CORPUS_INDEX_ENABLED='0',
+    PARSE_EXECUTOR='thread',
+    LOG_LEVEL='WARNING',
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
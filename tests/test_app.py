@@ -0,0 +1,8 @@
+import app
+
+
+def test_unknown_model_is_rejected():
+    client = app.app.test_client()
+    response = client.post('/', data={'search_query': 'tidal energy', 'model': 'no-such-model'})
+    assert response.status_code == 400
+    assert b'unknown model' in response.data
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import batch
+
+
+def write_queries(path, *queries):
+    path.write_text(''.join(json.dumps({'id': query, 'query': query}) + '\n' for query in queries))
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_empty_final_summary_is_an_error_and_retried(tmp_path, monkeypatch):
+    answers = {'good': 'An answer.', 'bad': ''}
+
+    async def run_query(model, query, **kwargs):
+        return answers[query]
+
+    monkeypatch.setattr(batch, 'run_query', run_query)
+    queries, output = tmp_path / 'queries.jsonl', tmp_path / 'results.jsonl'
+    write_queries(queries, 'good', 'bad')
+
+    asyncio.run(batch.run_batch(queries, output, 'openai'))
+    records = {record['id']: record for record in read_records(output)}
+    assert records['good']['error'] is None
+    assert records['bad']['error']
+    assert batch.load_checkpoint(output) == {'good'}
+
+    answers['bad'] = 'Now it works.'
+    assert asyncio.run(batch.run_batch(queries, output, 'openai')) == 1
+    assert batch.load_checkpoint(output) == {'good', 'bad'}
+
+
+def test_checkpoint_skips_failed_and_truncated_records(tmp_path):
+    output = tmp_path / 'results.jsonl'
+    output.write_text(
+        json.dumps({'key': 'done', 'error': None}) + '\n'
+        + json.dumps({'key': 'failed', 'error': 'timeout'}) + '\n'
+        + '{"key": "cut off", "err'
+    )
+    assert batch.load_checkpoint(output) == {'done'}
+    assert batch.load_checkpoint(tmp_path / 'missing.jsonl') == set()
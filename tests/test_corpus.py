@@ -0,0 +1,14 @@
+import time
+
+from corpus import CorpusIndex
+
+
+def test_old_documents_are_pruned(tmp_path):
+    index = CorpusIndex(str(tmp_path / 'corpus.db'), max_age=60)
+    index.put('https://example.com/old', 'Old page\nabout tidal energy')
+    index.execute('UPDATE documents SET fetched_at = ?', (time.time() - 120,))
+    index.put('https://example.com/new', 'New page\nabout tidal energy')
+
+    assert [row['url'] for row in index.search('tidal energy', 10)] == ['https://example.com/new']
+    assert index.execute('SELECT COUNT(*) FROM documents')[0][0] == 1
+    assert index.execute('SELECT COUNT(*) FROM documents_fts')[0][0] == 1
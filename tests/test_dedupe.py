@@ -0,0 +1,27 @@
+from dedupe import UrlFilter, canonical_url, url_key
+
+
+def test_canonical_url_keeps_the_fetchable_url():
+    assert canonical_url('https://m.example.com/a?amp=1&utm_source=x#top') == 'https://m.example.com/a?amp=1'
+    assert canonical_url('https://www.example.com/tags/amp') == 'https://www.example.com/tags/amp'
+    assert canonical_url('https://www.bbc.co.uk/news/story.amp.html') == 'https://www.bbc.co.uk/news/story.html'
+    assert canonical_url('https://www.google.com/amp/s/example.com/a') == 'https://example.com/a'
+
+
+def test_url_key_ignores_variants_of_the_same_page():
+    key = url_key('https://example.com/a')
+    for variant in ('http://www.example.com/a/', 'https://m.example.com/a', 'https://amp.example.com/a?amp=1',
+                    'https://example.com/a?utm_campaign=x'):
+        assert url_key(variant) == key
+    assert url_key('https://example.com/a?page=2') != key
+    assert url_key('https://example.com/tags/amp') != url_key('https://example.com/tags')
+
+
+def test_url_filter_drops_repeats_and_unscrapable_links():
+    urls = UrlFilter()
+    assert urls.admit('https://www.example.com/a') == ('https://www.example.com/a', None)
+    assert urls.admit('https://m.example.com/a/') == (None, 'duplicate')
+    assert urls.admit('https://example.com/tags/amp')[0] == 'https://example.com/tags/amp'
+    assert urls.admit('https://example.com/report.pdf') == (None, 'not HTML')
+    assert urls.admit('https://www.youtube.com/watch?v=1') == (None, 'video or social site')
+    assert (urls.duplicates, urls.skipped) == (1, 2)
@@ -0,0 +1,39 @@
+import jobqueue
+from jobqueue import SQLiteJobQueue
+
+
+def test_claim_takes_each_job_once_in_order(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    first = queue.submit('run', 'fetch', {'url': 'a'})
+    second = queue.submit('run', 'fetch', {'url': 'b'})
+    queue.submit('run', 'summarize', {'content': 'c'})
+
+    assert queue.claim(['fetch'], 'w1')['id'] == first
+    assert queue.claim(['fetch'], 'w2')['id'] == second
+    assert queue.claim(['fetch'], 'w3') is None
+
+    queue.complete(first, 'text')
+    queue.fail(second, 'boom')
+    assert queue.finished([first, second]) == {first: ('done', 'text', None), second: ('failed', None, 'boom')}
+
+
+def test_expired_lease_is_reclaimed_until_attempts_run_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobqueue, 'JOB_LEASE_SECONDS', -1)
+    monkeypatch.setattr(jobqueue, 'JOB_MAX_ATTEMPTS', 2)
+    queue = SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    job_id = queue.submit('run', 'fetch', {'url': 'a'})
+
+    assert queue.claim(['fetch'], 'w1')['id'] == job_id
+    assert queue.claim(['fetch'], 'w2')['id'] == job_id
+    assert queue.claim(['fetch'], 'w3') is None
+    assert queue.finished([job_id]) == {job_id: ('failed', None, 'worker lost')}
+
+
+def test_purge_keeps_jobs_still_awaited(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    shared = queue.submit('run', 'fetch', {'url': 'a'})
+    queue.submit('run', 'fetch', {'url': 'b'})
+    other = queue.submit('other', 'fetch', {'url': 'c'})
+
+    queue.purge('run', keep={shared})
+    assert [row['id'] for row in queue.execute('SELECT id FROM jobs ORDER BY created_at')] == [shared, other]
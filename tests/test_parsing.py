@@ -0,0 +1,22 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import signal
+
+import parsing
+
+PAGE = b'<html><head><title>T</title></head><body><main><p>A paragraph of real content for the test.</p></main></body></html>'
+
+
+def test_parse_pool_is_rebuilt_after_a_worker_dies(monkeypatch):
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+    monkeypatch.setattr(parsing, '_executor', pool)
+    monkeypatch.setattr(parsing, 'PARSE_EXECUTOR', 'process')
+    os.kill(pool.submit(os.getpid).result(), signal.SIGKILL)
+    try:
+        text, _ = asyncio.run(parsing.parse_page(PAGE, 'utf-8'))
+        assert 'A paragraph of real content' in text
+        assert parsing._executor is not pool
+    finally:
+        parsing.shutdown_executor()
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+import pipeline
+from benchmarks.mock_llm import MockProvider
+
+
+def run(urls, can_pack=None, workers=1, summarize_delay=0.0, **kwargs):
+    # Each "URL" is the scrape delay; page N is returned as "pageN".
+    async def scrape(delay, url_index):
+        await asyncio.sleep(delay)
+        return f"page{url_index}"
+
+    async def summarize(batch):
+        await asyncio.sleep(summarize_delay)
+        return '+'.join(page for _, page in batch)
+
+    return asyncio.run(pipeline.run_pipeline(urls, scrape, summarize, summarize_workers=workers, can_pack=can_pack, **kwargs))
+
+
+def test_rejected_pack_candidate_is_still_summarized():
+    # Pages 2 and 3 wait while page 1 is summarized, and page 3 cannot join
+    # page 2's batch. It used to be requeued behind the end-of-input marker
+    # and dropped.
+    summaries = run([0.0, 0.05, 0.05], can_pack=lambda batch, page: not batch, summarize_delay=0.2)
+    assert summaries == ['page1', 'page2', 'page3']
+
+
+def test_no_usable_pages_skips_the_final_call(monkeypatch):
+    async def no_results(query, backend=None, num_results=10):
+        return
+        yield
+
+    monkeypatch.setattr(pipeline, 'search_urls', no_results)
+    provider = MockProvider(first_token_latency=0, tokens_per_second=1e6)
+    with pytest.raises(pipeline.QueryFailed):
+        asyncio.run(pipeline.main('nothing to find', provider))
+    assert provider.calls == 0
+
+
+class BrokenStreamProvider(MockProvider):
+    async def stream(self, prompt, content):
+        yield 'The start of an answer '
+        raise ValueError('connection reset')
+
+
+def fake_pages(monkeypatch, count=3):
+    async def search_urls(query, backend=None, num_results=10):
+        for i in range(count):
+            yield f"http://site{i}.example/page"
+
+    async def scrape_plaintext(url, boilerplate=None):
+        return f"Title: {url}\n\nMain Content:\n" + f"Facts about {url}. " * 40
+
+    monkeypatch.setattr(pipeline, 'search_urls', search_urls)
+    monkeypatch.setattr(pipeline, 'scrape_plaintext', scrape_plaintext)
+
+
+def test_final_stream_error_fails_the_query(monkeypatch):
+    fake_pages(monkeypatch)
+    events = []
+    with pytest.raises(pipeline.QueryFailed):
+        asyncio.run(pipeline.main('facts', BrokenStreamProvider(first_token_latency=0, tokens_per_second=1e6), on_event=lambda *event: events.append(event)))
+    # The partial text was streamed, but the query is not reported as done.
+    assert ('token', {'text': 'The start of an answer '}) in events
+
+
+def test_page_memo_shares_pages_not_another_querys_filtering(monkeypatch):
+    # Query A drops mirror.example as a near-duplicate of origin.example.
+    # Query B only finds the mirror and must still get it.
+    results = {'a': ['http://origin.example/story', 'http://mirror.example/story'], 'b': ['http://mirror.example/story']}
+    article = "Title: Story\n\nMain Content:\n" + ' '.join(f"Sentence {i} of the syndicated story." for i in range(60))
+    fetched = []
+
+    async def search_urls(query, backend=None, num_results=10):
+        for url in results[query]:
+            yield url
+
+    async def scrape_plaintext(url, boilerplate=None):
+        fetched.append(url)
+        return article
+
+    monkeypatch.setattr(pipeline, 'search_urls', search_urls)
+    monkeypatch.setattr(pipeline, 'scrape_plaintext', scrape_plaintext)
+    monkeypatch.setattr(pipeline, 'QUERY_FOCUS', False)
+    memo = pipeline.PageMemo()
+
+    async def run_both():
+        provider = MockProvider(first_token_latency=0, tokens_per_second=1e6)
+        await pipeline.main('a', provider, page_memo=memo)
+        return await pipeline.main('b', provider, page_memo=memo)
+
+    assert asyncio.run(run_both())
+    assert sorted(fetched) == sorted(results['a'])
+
+
+def test_quorum_stops_scraping_once_enough_pages_are_in():
+    summaries = run([0.0, 0.0, 5.0, 5.0], quorum=2)
+    assert summaries == ['page1', 'page2']
+
+
+def test_deadline_cancels_outstanding_scrapes():
+    summaries = run([0.0, 5.0], deadline=0.2)
+    assert summaries == ['page1']
+
+
+def test_failed_scrape_only_loses_its_own_page():
+    async def scrape(url, url_index):
+        if url == 'bad':
+            raise ValueError('connection refused')
+        return url
+
+    async def summarize(batch):
+        return '+'.join(page for _, page in batch)
+
+    summaries = asyncio.run(pipeline.run_pipeline(['a', 'bad', 'c'], scrape, summarize, summarize_workers=2))
+    assert summaries == ['a', 'c']
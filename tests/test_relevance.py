@@ -0,0 +1,29 @@
+from relevance import PassageFilter
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_keeps_title_and_best_passages_in_page_order():
+    filler = ' '.join(['filler'] * 20)
+    text = '\n\n'.join([
+        'Title: Renewable energy',
+        filler,
+        'Tidal energy turns the rise and fall of the sea into electricity.',
+        filler,
+        'Tidal barrages and tidal stream generators are the main kinds.',
+    ])
+    passages = PassageFilter('tidal energy', max_tokens=30)
+
+    assert passages.select(text, count_words) == '\n\n'.join([
+        'Title: Renewable energy',
+        'Tidal energy turns the rise and fall of the sea into electricity.',
+        'Tidal barrages and tidal stream generators are the main kinds.',
+    ])
+    assert passages.dropped_tokens == 40
+
+
+def test_pages_within_the_budget_are_left_whole():
+    text = 'Title: Short\n\nNothing about the query here.'
+    assert PassageFilter('tidal energy', max_tokens=100).select(text, count_words) == text
@@ -0,0 +1,52 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight('test')
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return key.upper()
+
+    async def main():
+        return await asyncio.gather(*(flights.do('a', fetch, 'a') for _ in range(3)), flights.do('b', fetch, 'b'))
+
+    assert asyncio.run(main()) == ['A', 'A', 'A', 'B']
+    assert sorted(calls) == ['a', 'b']
+
+
+def test_shared_call_is_cancelled_only_when_every_caller_leaves():
+    flights = SingleFlight('test')
+    started = []
+    cancelled = []
+
+    async def fetch():
+        started.append(True)
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        first = asyncio.create_task(flights.do('a', fetch))
+        second = asyncio.create_task(flights.do('a', fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled
+        second.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled
+        # A later caller starts a new call rather than joining the cancelled one.
+        third = asyncio.create_task(flights.do('a', fetch))
+        await asyncio.sleep(0.01)
+        third.cancel()
+        await asyncio.gather(first, second, third, return_exceptions=True)
+
+    asyncio.run(main())
+    assert len(started) == 2
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+
+import pipeline
+from jobqueue import get_job_queue, in_worker
+from parsing import BoilerplateFilter
+from providers import get_provider
+from search import get_search_backend
+
+logger = logging.getLogger(__name__)
+
+WORKER_KINDS = ('search', 'fetch', 'summarize')
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 8))
+
+
+async def handle_search(query, backend, num_results):
+    return [url async for url in pipeline.search_urls(query, get_search_backend(backend), num_results)]
+
+
+async def handle_fetch(url):
+    boilerplate = BoilerplateFilter()
+    text = await pipeline.scrape_plaintext(url, boilerplate)
+    if text is None:
+        return None
+    return {'text': text, 'removed_chars': boilerplate.extracted_chars}
+
+
+async def handle_summarize(model, content, prompt):
+    return await pipeline.summarize(get_provider(model), content, prompt)
+
+
+HANDLERS = {
+    'search': handle_search,
+    'fetch': handle_fetch,
+    'summarize': handle_summarize,
+}
+
+
+async def run_worker(kinds=WORKER_KINDS, concurrency=WORKER_CONCURRENCY, name=None):
+    # Takes jobs of the given kinds from the queue and runs them here, so
+    # fetch and LLM capacity can be scaled separately by starting workers
+    # with different kinds on as many machines as needed.
+    queue = get_job_queue()
+    if queue is None:
+        raise RuntimeError("Set QPAL_QUEUE to the job queue backend (e.g. sqlite) to run a worker.")
+    in_worker.set(True)
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    logger.info("Worker %s taking %s jobs from the %s queue, %s at a time.", name, ', '.join(kinds), queue.name, concurrency)
+
+    async def consume():
+        while True:
+            job = await queue.next_job(kinds, name)
+            start = time.perf_counter()
+            try:
+                result = await HANDLERS[job['kind']](**job['payload'])
+            except Exception as e:
+                logger.error("%s job %s failed: %s", job['kind'], job['id'], e)
+                queue.fail(job['id'], str(e))
+                continue
+            queue.complete(job['id'], result)
+            logger.info("%s job %s for run %s done in %.2fs.", job['kind'], job['id'], job['run_id'], time.perf_counter() - start)
+
+    await asyncio.gather(*(consume() for _ in range(max(1, concurrency))))
@@ -0,0 +1,33 @@
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# When set, every run writes its intermediate files (URLS.txt, URLoutput/,
+# URLsummaries/, Finalsummary.txt) to QPAL_SCRATCH_DIR/<run_id>/ for inspection.
+# Results themselves are always passed in memory.
+QPAL_SCRATCH_DIR = os.environ.get('QPAL_SCRATCH_DIR', '')
+
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+
+class Workspace:
+    def __init__(self, run_id=None, root=QPAL_SCRATCH_DIR):
+        self.run_id = run_id or new_run_id()
+        self.path = os.path.join(root, self.run_id) if root else None
+
+    def write(self, relative_path, text):
+        if self.path is None:
+            return None
+        file_path = os.path.join(self.path, relative_path)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write(text)
+        except OSError as e:
+            logger.error("Error writing %s: %s", file_path, e)
+            return None
+        return file_path